@@ -0,0 +1,65 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules that must NOT be imported while the bot process starts. They are loaded
+# lazily (db -> gsheets in the background, telegram in __main__) after the health
+# port is open.
+HEAVY_MODULES = {"pandas", "numpy", "gspread", "oauth2client", "streamlit", "plotly", "telegram"}
+
+# Default budget for `import bot` (cumulative import time, milliseconds)
+DEFAULT_BUDGET_MS = 1500
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+
+def measure_imports(module="bot"):
+    """
+    Runs `python -X importtime -c "import <module>"` from src/ and returns
+    {top_level_package: cumulative_us} plus the set of every imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    top_level = {}
+    imported = set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imported.add(name.strip().split(".")[0])
+        # Nesting is shown by indentation, top-level entries have a single leading space
+        if not name.startswith("  "):
+            top_level[name.strip()] = int(cumulative)
+    return top_level, imported
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the bot's cold-start import cost.")
+    parser.add_argument("--budget-ms", type=int, default=int(os.environ.get("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS)))
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to show")
+    args = parser.parse_args()
+
+    top_level, imported = measure_imports("bot")
+    total_ms = sum(top_level.values()) / 1000
+
+    print(f"⏱️  import bot: {total_ms:.0f} ms (budget {args.budget_ms} ms)")
+    for name, us in sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"   {us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = sorted(HEAVY_MODULES & imported)
+    if eager:
+        print(f"❌ Heavy modules imported at startup: {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"❌ Startup import time over budget.")
+        failed = True
+
+    if not failed:
+        print("✅ Startup OK.")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,455 @@
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+# Load test for the bot handlers.
+#
+# Builds real telegram Update / Message / CallbackQuery objects and feeds them to
+# handle_message, button_handler and check_pending_transactions at a given rate and
+# concurrency. Nothing leaves the machine:
+#   - FakeBot records send_message / edit_message_text / answer_callback_query
+#   - LocalSheets stands in for gsheets.py (in memory, optional simulated latency)
+#   - FakeJobQueue runs the run_once jobs the handlers schedule (digest, outbox)
+#   - outbox / tenants / budgets files go to a temporary directory
+#
+# Reports throughput, latency percentiles per update kind, event-loop blocking time
+# (measured with a probe task) and storage calls per update.
+#
+#   python load_test.py --updates 500 --rate 50 --concurrency 20 --latency-ms 150
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+
+# Same list as gsheets.get_categories (importing gsheets would pull in gspread)
+CATEGORIES = ['Comida', 'Transporte', 'Servicios', 'Ocio', 'Salud', 'Educación', 'Ropa', 'Ahorro', 'Otros']
+COLUMNS_V2 = ["id", "date", "month", "year", "amount", "description", "category", "source", "status"]
+
+DESCRIPTIONS = ["Yape Juan", "Netflix", "Menu almuerzo", "Taxi", "Plin Maria", "Farmacia", "Cine", "Luz del Sur"]
+
+# Storage calls are attributed to the update kind (or job) that made them
+_kind = contextvars.ContextVar("load_test_kind", default="other")
+
+class LocalSheets:
+    """In-memory stand-in for the gsheets module (same functions and signatures)."""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000
+        self.calls = Counter()  # (kind, function) -> n
+        self._lock = threading.Lock()
+        self._rows = {}         # spreadsheet_id -> [V2 row]
+        self._versions = {}     # spreadsheet_id -> int
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[(_kind.get(), name)] += 1
+        if self.latency:
+            # gspread is synchronous: block like an HTTP round trip would
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def _bump(self, spreadsheet_id):
+        self._versions[spreadsheet_id] = self._versions.get(spreadsheet_id, 0) + 1
+
+    def seed(self, rows, spreadsheet_id=None):
+        with self._lock:
+            self._rows.setdefault(spreadsheet_id, []).extend(list(r) for r in rows)
+            self._bump(spreadsheet_id)
+
+    def warm_up(self, spreadsheet_id=None):
+        self._call("warm_up")
+        return True
+
+    def get_categories(self):
+        return list(CATEGORIES)
+
+    def last_written_version(self, spreadsheet_id=None):
+        with self._lock:
+            return self._versions.get(spreadsheet_id, 0)
+
+    def get_data_version(self, spreadsheet_id=None):
+        self._call("get_data_version")
+        with self._lock:
+            return self._versions.get(spreadsheet_id, 0)
+
+    def get_pending_ids(self, spreadsheet_id=None):
+        self._call("get_pending_ids")
+        with self._lock:
+            rows = self._rows.get(spreadsheet_id, [])
+            return {str(r[0]): i + 2 for i, r in enumerate(rows) if r[8] == 'pending_classification'}
+
+    def get_rows(self, row_numbers, spreadsheet_id=None):
+        self._call("get_rows")
+        with self._lock:
+            rows = self._rows.get(spreadsheet_id, [])
+            return [dict(zip(COLUMNS_V2, rows[n - 2])) for n in row_numbers if 0 <= n - 2 < len(rows)]
+
+    def append_transactions(self, rows, spreadsheet_id=None):
+        self._call("append_transactions")
+        with self._lock:
+            self._rows.setdefault(spreadsheet_id, []).extend(list(r) for r in rows)
+            self._bump(spreadsheet_id)
+        return True
+
+    def get_transaction_ids(self, spreadsheet_id=None):
+        self._call("get_transaction_ids")
+        with self._lock:
+            return {str(r[0]) for r in self._rows.get(spreadsheet_id, [])}
+
+    def update_category(self, txn_id, category, status="verified", spreadsheet_id=None):
+        return self._update({str(txn_id)}, category, status, spreadsheet_id, "update_category")
+
+    def update_categories(self, txn_ids, category, status="verified", spreadsheet_id=None):
+        return self._update({str(t) for t in txn_ids}, category, status, spreadsheet_id, "update_categories")
+
+    def _update(self, txn_ids, category, status, spreadsheet_id, name):
+        self._call(name)
+        with self._lock:
+            found = False
+            for row in self._rows.get(spreadsheet_id, []):
+                if str(row[0]) in txn_ids:
+                    row[6], row[8] = category, status
+                    found = True
+            if found:
+                self._bump(spreadsheet_id)
+            return found
+
+    def get_transactions_df(self, spreadsheet_id=None):
+        import pandas as pd
+        self._call("get_transactions_df")
+        with self._lock:
+            return pd.DataFrame([list(r) for r in self._rows.get(spreadsheet_id, [])], columns=COLUMNS_V2)
+
+class FakeBot:
+    """Records the Bot API calls the handlers make instead of sending them."""
+
+    defaults = None
+
+    def __init__(self):
+        self.calls = Counter()
+        self.keyboards = {}  # chat_id -> (message_id, reply_markup) of the last digest message
+        self._message_ids = itertools.count(1_000_000)
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.calls["send_message"] += 1
+        message_id = next(self._message_ids)
+        if reply_markup is not None:
+            self.keyboards[chat_id] = (message_id, reply_markup)
+        return message_id
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        self.calls["edit_message_text"] += 1
+        if reply_markup is not None:
+            self.keyboards[chat_id] = (message_id, reply_markup)
+        else:
+            self.keyboards.pop(chat_id, None)
+        return True
+
+    async def answer_callback_query(self, callback_query_id, **kwargs):
+        self.calls["answer_callback_query"] += 1
+        return True
+
+class FakeJob:
+    def __init__(self, callback, chat_id, name):
+        self.callback, self.chat_id, self.name = callback, chat_id, name
+
+class FakeJobQueue:
+    """
+    Runs run_once jobs on the event loop (delays multiplied by time_scale) and keeps
+    them listed until they finish, so the handlers' coalescing logic still applies.
+    Repeating jobs are only recorded: a load test run is shorter than their interval.
+    """
+
+    def __init__(self, harness, time_scale):
+        self.harness = harness
+        self.time_scale = time_scale
+        self.repeating = {}
+        self._pending = {}  # name -> [FakeJob]
+        self.tasks = set()
+
+    def get_jobs_by_name(self, name):
+        return list(self._pending.get(name, [])) or ([self.repeating[name]] if name in self.repeating else [])
+
+    def run_repeating(self, callback, interval, first=None, chat_id=None, name=None, **kwargs):
+        self.repeating[name] = FakeJob(callback, chat_id, name)
+        return self.repeating[name]
+
+    def run_once(self, callback, when, chat_id=None, name=None, **kwargs):
+        job = FakeJob(callback, chat_id, name)
+        self._pending.setdefault(name, []).append(job)
+        task = asyncio.get_running_loop().create_task(self._run(job, when * self.time_scale))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    async def _run(self, job, delay):
+        await asyncio.sleep(delay)
+        _kind.set("job:" + (job.name or "").split("_")[0])
+        try:
+            await job.callback(self.harness.context(job.chat_id, job=job))
+        except Exception as e:
+            self.harness.errors["job"] += 1
+            print(f"Job {job.name} failed: {e!r}")
+        finally:
+            self._pending[job.name].remove(job)
+
+class FakeContext:
+    """The parts of CallbackContext the handlers use."""
+
+    def __init__(self, bot, job_queue, chat_data, bot_data, job=None, args=None):
+        self.bot, self.job_queue = bot, job_queue
+        self.chat_data, self.bot_data = chat_data, bot_data
+        self.job, self.args = job, args
+
+class LoopProbe:
+    """
+    Measures event-loop blocking: a task that wakes up every `interval` seconds and
+    records how late it was. Lateness is time the loop spent running something else
+    without yielding (e.g. a blocking storage call made directly on the loop).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.blocked = 0.0
+        self.worst = 0.0
+        self._stop = False
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stop:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            # Ignore scheduler jitter below one millisecond
+            if lag > 0.001:
+                self.blocked += lag
+                self.worst = max(self.worst, lag)
+
+    def stop(self):
+        self._stop = True
+
+class Harness:
+    def __init__(self, args, bot_module, storage):
+        self.args = args
+        self.bot_module = bot_module
+        self.storage = storage
+        self.bot = FakeBot()
+        self.job_queue = FakeJobQueue(self, args.time_scale)
+        self.chat_data = {}
+        self.bot_data = {}
+        self.latencies = {}  # kind -> [seconds]
+        self.kinds = Counter()
+        self.errors = Counter()
+        self._update_ids = itertools.count(1)
+        self._bot_user = None
+
+    def context(self, chat_id, job=None):
+        return FakeContext(self.bot, self.job_queue, self.chat_data.setdefault(chat_id, {}), self.bot_data, job=job)
+
+    def _chat(self, chat_id):
+        from telegram import Chat, User
+        return Chat(id=chat_id, type="private"), User(id=chat_id, first_name=f"Load {chat_id}", is_bot=False)
+
+    def message_update(self, chat_id, text):
+        from telegram import Message, Update
+        chat, user = self._chat(chat_id)
+        update_id = next(self._update_ids)
+        message = Message(message_id=update_id, date=datetime.now(timezone.utc), chat=chat, from_user=user, text=text)
+        message.set_bot(self.bot)
+        return Update(update_id=update_id, message=message)
+
+    def callback_update(self, chat_id, message_id, data):
+        from telegram import CallbackQuery, Message, Update, User
+        chat, user = self._chat(chat_id)
+        if self._bot_user is None:
+            self._bot_user = User(id=1, first_name="Finanzas Bot", is_bot=True)
+        update_id = next(self._update_ids)
+        message = Message(message_id=message_id, date=datetime.now(timezone.utc), chat=chat, from_user=self._bot_user, text="digest")
+        message.set_bot(self.bot)
+        query = CallbackQuery(id=str(update_id), from_user=user, chat_instance=str(chat_id), data=data, message=message)
+        query.set_bot(self.bot)
+        return Update(update_id=update_id, callback_query=query)
+
+    def _pick_button(self, chat_id):
+        """callback_data of a category button in the chat's current digest message."""
+        entry = self.bot.keyboards.get(chat_id)
+        if entry is None:
+            return None
+        message_id, markup = entry
+        buttons = [b.callback_data for row in markup.inline_keyboard for b in row
+                   if b.callback_data and b.callback_data[0] in "cs"]
+        return (message_id, random.choice(buttons)) if buttons else None
+
+    async def one_update(self, n):
+        """Build and handle a single update; returns its kind."""
+        bot = self.bot_module
+        chat_id = 10_000 + n % self.args.chats
+        kind = random.choices(["message", "button", "digest"], weights=self.args.mix)[0]
+        button = self._pick_button(chat_id) if kind == "button" else None
+        if kind == "button" and button is None:
+            # Nothing to press yet in this chat: send a message instead
+            kind = "message"
+
+        _kind.set(kind)
+        context = self.context(chat_id)
+        if kind == "message":
+            text = f"{random.choice(DESCRIPTIONS)} {random.randint(5, 300)}.{random.randint(0, 99):02d}"
+            await bot.handle_message(self.message_update(chat_id, text), context)
+        elif kind == "button":
+            await bot.button_handler(self.callback_update(chat_id, *button), context)
+        else:
+            await bot.check_pending_transactions(context, chat_id=chat_id)
+        return kind
+
+    async def _timed(self, n, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                kind = await self.one_update(n)
+            except Exception as e:
+                self.errors["update"] += 1
+                print(f"Update {n} failed: {e!r}")
+                return
+            self.latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            self.kinds[kind] += 1
+
+    async def run(self):
+        args = self.args
+        probe = LoopProbe()
+        probe_task = asyncio.create_task(probe.run())
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        start = time.perf_counter()
+        tasks = []
+        for n in range(args.updates):
+            if args.rate:
+                # Open loop: updates arrive on schedule whether or not earlier ones finished
+                delay = start + n / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self._timed(n, semaphore)))
+            else:
+                # Closed loop: keep `concurrency` updates in flight
+                await semaphore.acquire()
+                semaphore.release()
+                tasks.append(asyncio.create_task(self._timed(n, semaphore)))
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        handled = time.perf_counter() - start
+
+        # Let the scheduled digests / outbox drains triggered by the updates finish
+        while self.job_queue.tasks:
+            await asyncio.gather(*list(self.job_queue.tasks))
+        total = time.perf_counter() - start
+
+        probe.stop()
+        await probe_task
+        return handled, total, probe
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def print_report(harness, handled, total, probe):
+    args = harness.args
+    done = sum(harness.kinds.values())
+    print(f"\n📈 {done} updates in {handled:.2f}s -> {done / handled:.1f} updates/s "
+          f"(rate {args.rate or 'max'}, concurrency {args.concurrency}, {args.chats} chats, "
+          f"storage latency {args.latency_ms:.0f}ms)")
+    print(f"   background jobs done after {total:.2f}s, errors: {dict(harness.errors) or 0}")
+
+    print(f"\n{'kind':10} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for kind in sorted(harness.latencies):
+        values = sorted(harness.latencies[kind])
+        p50, p95, p99 = (_percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"{kind:10} {len(values):>6} {p50:>7.1f}ms {p95:>7.1f}ms {p99:>7.1f}ms {values[-1] * 1000:>7.1f}ms")
+
+    print(f"\n⏸️  Event loop blocked {probe.blocked * 1000:.0f}ms in total "
+          f"({probe.blocked / total:.1%} of the run), worst stall {probe.worst * 1000:.1f}ms")
+
+    per_kind = Counter()
+    per_function = Counter()
+    for (kind, name), count in harness.storage.calls.items():
+        per_kind[kind] += count
+        per_function[name] += count
+    all_calls = sum(per_kind.values())
+    print(f"\n🗄️  Storage calls: {all_calls} ({all_calls / max(done, 1):.2f} per update)")
+    for kind, count in sorted(per_kind.items()):
+        handled_kind = harness.kinds.get(kind)
+        ratio = f"{count / handled_kind:.2f} per update" if handled_kind else "background"
+        print(f"   {kind:18} {count:>6}  {ratio}")
+    for name, count in per_function.most_common():
+        print(f"   - {name:25} {count:>6}")
+
+    print(f"\n🤖 Bot API calls: {dict(harness.bot.calls)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic Telegram updates through the bot handlers.")
+    parser.add_argument("--updates", type=int, default=300, help="How many updates to send")
+    parser.add_argument("--rate", type=float, default=0, help="Updates per second (0 = as fast as concurrency allows)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Max updates handled at the same time")
+    parser.add_argument("--chats", type=int, default=5, help="Number of simulated chats (one spreadsheet each)")
+    parser.add_argument("--mix", type=float, nargs=3, default=[6, 3, 1], metavar=("MESSAGE", "BUTTON", "DIGEST"),
+                        help="Relative weights of the update kinds")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Simulated latency of each storage call")
+    parser.add_argument("--seed-rows", type=int, default=200, help="Existing rows per chat ledger (10%% pending)")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="Multiplier for scheduled job delays (digest debounce)")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's own output instead of logging it to a file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    # Keep the real local state untouched and the tenant limits out of the way
+    os.environ.update({
+        "OUTBOX_FILE": os.path.join(workdir, "outbox.jsonl"),
+        "CHATS_FILE": os.path.join(workdir, "chats.json"),
+        "BUDGETS_FILE": os.path.join(workdir, "budgets.json"),
+    })
+    os.environ.setdefault("TENANT_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("TENANT_BURST", "1000000")
+    sys.path.insert(0, SRC_DIR)
+
+    import logging
+    import bot
+    import db
+    import tenants
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    storage = LocalSheets(latency_ms=args.latency_ms)
+    db._gsheets = storage
+
+    random.seed(0)
+    for c in range(args.chats):
+        chat_id = 10_000 + c
+        tenants.set_spreadsheet(chat_id, f"load_test_{chat_id}")
+        rows = []
+        for i in range(args.seed_rows):
+            row = db.new_transaction_row(
+                f"2026-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 12:00:00",
+                round(random.uniform(5, 300), 2), random.choice(DESCRIPTIONS), "Seed",
+                random.choice(CATEGORIES), "pending_classification" if i % 10 == 0 else "verified"
+            )
+            row[0] = f"seed_{chat_id}_{i}"
+            rows.append(row)
+        storage.seed(rows, spreadsheet_id=f"load_test_{chat_id}")
+
+    harness = Harness(args, bot, storage)
+    log_path = os.path.join(workdir, "bot_output.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        redirect = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(log)
+        with redirect:
+            handled, total, probe = asyncio.run(harness.run())
+
+    print_report(harness, handled, total, probe)
+    if not args.verbose:
+        print(f"\nBot output: {log_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+from src.gsheets import get_db_connection, bump_version, SPREADSHEET_ID, WORKSHEET_NAME, COLUMNS, COLUMNS_V2
+
+# Bounded reads: each get_values call pulls at most this many rows
+READ_CHUNK_ROWS = 1000
+# Rows per append_rows call
+WRITE_BATCH_ROWS = 500
+# Google Sheets allows ~60 write requests per minute per user, stay below it
+WRITES_PER_MINUTE = 50
+
+CHECKPOINT_FILE = "migration_checkpoint.json"
+
+def legacy_to_v2(chunk):
+    """
+    Transforms a chunk of legacy rows (id, date, amount, desc, cat, source, status)
+    into V2 rows (id, date, MONTH, YEAR, amount, desc, cat, source, status).
+    Dates are parsed for the whole chunk at once.
+    """
+    df = pd.DataFrame(chunk).reindex(columns=range(len(COLUMNS)))
+    df.columns = COLUMNS
+    # Like the old row_values check: require the full 7 legacy columns
+    df = df[df["id"].astype(str).str.startswith("txn_") & (df["status"].fillna("").astype(str) != "")]
+    if df.empty:
+        return []
+
+    dates = pd.to_datetime(df["date"], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    df["month"] = dates.dt.strftime("%m").fillna("Unknown")
+    df["year"] = dates.dt.strftime("%Y").fillna("Unknown")
+
+    return df[COLUMNS_V2].fillna("").values.tolist()
+
+def _load_checkpoint(key):
+    if not os.path.exists(CHECKPOINT_FILE):
+        return 1
+    with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+        return json.load(f).get(key, 1)
+
+def _save_checkpoint(key, next_row):
+    data = {}
+    if os.path.exists(CHECKPOINT_FILE):
+        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    data[key] = next_row
+    tmp_path = CHECKPOINT_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, CHECKPOINT_FILE)
+
+def migrate(source_name, target_name=WORKSHEET_NAME, transform=legacy_to_v2, restart=False):
+    """
+    Streams rows from source_name into target_name.
+
+    - Reads the source in bounded get_values range chunks.
+    - Transforms each chunk with `transform` (list of rows -> list of target rows).
+    - Skips rows whose id already exists in the target.
+    - Writes with chunked append_rows calls under the write rate limit.
+    - Checkpoints the next source row after every chunk so an interrupted run resumes.
+    """
+    print(f"🚀 Migrating '{source_name}' -> '{target_name}'...")
+    client = get_db_connection()
+    if not client:
+        print("❌ No connection.")
+        return False
+
+    key = f"{source_name}->{target_name}"
+    start_row = 1 if restart else _load_checkpoint(key)
+    if start_row > 1:
+        print(f"↩️  Resuming from row {start_row}.")
+
+    try:
+        ss = client.open_by_key(SPREADSHEET_ID)
+        source_ws = ss.worksheet(source_name)
+        target_ws = ss.worksheet(target_name)
+
+        # One read of the target ids for de-duplication
+        existing_ids = set(target_ws.col_values(1))
+        print(f"   Target already has {len(existing_ids)} ids.")
+
+        min_interval = 60.0 / WRITES_PER_MINUTE
+        last_write = 0.0
+        migrated = skipped = 0
+        last_row = source_ws.row_count
+
+        while start_row <= last_row:
+            end_row = min(start_row + READ_CHUNK_ROWS - 1, last_row)
+            chunk = source_ws.get_values(f"A{start_row}:I{end_row}")
+            if not chunk:
+                # get_values trims trailing empty rows, nothing left to read
+                break
+
+            rows = []
+            for row in transform(chunk):
+                if row[0] in existing_ids:
+                    skipped += 1
+                    continue
+                existing_ids.add(row[0])
+                rows.append(row)
+
+            for i in range(0, len(rows), WRITE_BATCH_ROWS):
+                wait = min_interval - (time.monotonic() - last_write)
+                if wait > 0:
+                    time.sleep(wait)
+                target_ws.append_rows(rows[i:i + WRITE_BATCH_ROWS])
+                last_write = time.monotonic()
+            if rows:
+                # Raw appends don't stamp the data version: bump it so the bot and
+                # the dashboard reload instead of serving their cached copy
+                wait = min_interval - (time.monotonic() - last_write)
+                if wait > 0:
+                    time.sleep(wait)
+                bump_version(SPREADSHEET_ID)
+                last_write = time.monotonic()
+
+            migrated += len(rows)
+            start_row = end_row + 1
+            _save_checkpoint(key, start_row)
+            print(f"   Rows up to {end_row}: {migrated} migrated, {skipped} already present.")
+
+        print(f"✅ Done. {migrated} rows migrated, {skipped} skipped.")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error: {e} (progress saved, re-run to resume)")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream rows from a legacy tab into the V2 data tab.")
+    parser.add_argument("source", nargs="?", default="Dashboard_Gastos_v2", help="Source worksheet name")
+    parser.add_argument("--target", default=WORKSHEET_NAME, help="Target worksheet name")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    migrate(args.source, args.target, restart=args.restart)
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+# Recurring expense / subscription detection over the ledger.
+#
+# Transactions are grouped by normalized description, source and amount band
+# (amounts within ~15% of each other share a band). For each group the gaps between
+# consecutive dates decide the period: monthly (26-35 days) or weekly (6-8 days).
+# Everything is done with vectorized pandas/NumPy operations (no per-row loops), so
+# 100k rows take a fraction of a second.
+#
+# Results are cached per ledger with the row count, last id and data version they
+# were computed from. Rows appended at the end (the usual change) only recompute
+# the groups they touch; edits or deletions recompute everything.
+
+MIN_OCCURRENCES = 3
+# Share of gaps that must match the period for the group to count as recurring
+MIN_REGULARITY = 0.6
+# Width of an amount band on a log scale (log(1.15) ~ 15%)
+AMOUNT_BAND = np.log(1.15)
+
+PERIODS = {
+    "mensual": (26, 35, 1.0),        # (min days, max days, occurrences per month)
+    "semanal": (6, 8, 52 / 12),
+}
+
+RESULT_COLUMNS = ["key", "description", "source", "amount", "period", "occurrences", "last_date", "next_date", "monthly_cost"]
+
+_cache = {}  # ledger -> {"version", "rows", "last_id", "prepared": DataFrame, "result": DataFrame}
+
+def _on_uniques(values, func):
+    """
+    Apply a vectorized transform to the distinct values only, then broadcast back.
+    Descriptions and days repeat a lot, so this cuts most of the string work.
+    """
+    codes, uniques = pd.factorize(values)
+    mapped = func(pd.Series(uniques, dtype=object))
+    return pd.Series(mapped.to_numpy()[codes], index=values.index).where(codes >= 0)
+
+def _normalize_text(s):
+    return (
+        s.astype(str).str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+        .str.lower().str.replace(r"[^a-z ]+", " ", regex=True).str.split().str.join(" ")
+    )
+
+def _prepare(df):
+    """Add the grouping key and parsed date/amount columns (vectorized)."""
+    out = pd.DataFrame({
+        "id": df["id"].astype(str),
+        "description": df["description"].astype(str),
+        "source": df["source"].astype(str),
+    })
+    desc = _on_uniques(out["description"], _normalize_text).fillna("")
+    amount = pd.to_numeric(df["amount"], errors="coerce")
+    band = np.floor(np.log(amount.where(amount > 0)) / AMOUNT_BAND)
+
+    # Only the day matters: parse the distinct "YYYY-MM-DD" prefixes
+    days = df["date"].astype(str).str.slice(0, 10)
+    dates = pd.to_datetime(_on_uniques(days, lambda u: pd.to_datetime(u, format="%Y-%m-%d", errors="coerce")))
+
+    out["amount"] = amount
+    out["date"] = dates
+    out["key"] = desc + "|" + out["source"].str.lower() + "|" + band.astype("Int64").astype(str)
+    return out[amount.notna() & band.notna() & dates.notna() & (desc != "")]
+
+def _detect(prepared):
+    """Detect recurring groups in an already prepared frame."""
+    if prepared.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    p = prepared.sort_values(["key", "date"])
+    gaps = p.groupby("key", sort=False)["date"].diff().dt.days
+    p = p.assign(gap=gaps)
+
+    groups = p.groupby("key", sort=False)
+    stats = pd.DataFrame({
+        "occurrences": groups.size(),
+        "median_gap": groups["gap"].median(),
+        "amount": groups["amount"].mean().round(2),
+        "last_date": groups["date"].max(),
+        "description": groups["description"].last(),
+        "source": groups["source"].last(),
+    })
+    stats = stats[stats["occurrences"] >= MIN_OCCURRENCES]
+    if stats.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    # Period per group from the median gap, then the share of gaps that fit it
+    conditions = [stats["median_gap"].between(lo, hi) for lo, hi, _ in PERIODS.values()]
+    stats["period"] = np.select(conditions, list(PERIODS), default="")
+    stats = stats[stats["period"] != ""]
+    if stats.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    lo = stats["period"].map({name: v[0] for name, v in PERIODS.items()})
+    hi = stats["period"].map({name: v[1] for name, v in PERIODS.items()})
+    gap_rows = p[p["key"].isin(stats.index) & p["gap"].notna()]
+    fits = gap_rows["gap"].between(gap_rows["key"].map(lo), gap_rows["key"].map(hi))
+    regularity = fits.groupby(gap_rows["key"]).mean()
+    stats = stats[regularity.reindex(stats.index).fillna(0) >= MIN_REGULARITY]
+
+    per_month = stats["period"].map({name: v[2] for name, v in PERIODS.items()})
+    stats["next_date"] = stats["last_date"] + pd.to_timedelta(stats["median_gap"], unit="D")
+    stats["monthly_cost"] = (stats["amount"] * per_month).round(2)
+    return stats.reset_index()[RESULT_COLUMNS]
+
+def recurring(df, ledger=None, data_version=None):
+    """
+    Recurring charges in the ledger, most expensive per month first.
+    When df is the previous frame plus rows appended at the end, only the groups
+    those rows touch are recomputed; anything else (edits, deletions) recomputes.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    cached = _cache.get(ledger)
+    tail = None
+    if cached is not None and cached["rows"] <= len(df) and str(df["id"].iat[cached["rows"] - 1]) == cached["last_id"]:
+        tail = df.iloc[cached["rows"]:]
+        if tail.empty and data_version != cached["version"]:
+            # Same rows, new data version: edited in place
+            tail = None
+
+    if tail is None:
+        prepared = _prepare(df)
+        result = _detect(prepared)
+    elif tail.empty:
+        return cached["result"]
+    else:
+        new_prepared = _prepare(tail)
+        prepared = pd.concat([cached["prepared"], new_prepared], ignore_index=True)
+        touched = set(new_prepared["key"])
+        recomputed = _detect(prepared[prepared["key"].isin(touched)])
+        kept = cached["result"][~cached["result"]["key"].isin(touched)]
+        result = pd.concat([kept, recomputed], ignore_index=True) if not recomputed.empty else kept
+
+    result = result.sort_values("monthly_cost", ascending=False, ignore_index=True)
+    _cache[ledger] = {"version": data_version, "rows": len(df), "last_id": str(df["id"].iat[-1]),
+                      "prepared": prepared, "result": result}
+    return result
@@ -1,12 +1,28 @@
+from __future__ import annotations  # handler annotations name telegram types, imported later
+
+import time
+_STARTED_AT = time.perf_counter()
+
 import logging
 import asyncio
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler
-from db import get_transactions_df, update_transaction_category, get_categories
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    # The telegram stack is imported in __main__, once the health port is open
+    from telegram import Update
+    from telegram.ext import ContextTypes
+import os
+from db import warm_up, default_spreadsheet_id, get_data_version, last_written_version, get_pending_snapshot, refresh_pending, update_transaction_category, update_transactions_category, get_categories
+import callbacks
+import outbox
+import budgets
+import ledger_cache
+import search
+from profiling import profiled, span, report
+from tenants import load_chats, register_chat, get_spreadsheet, set_spreadsheet, claim_spreadsheet, has_ledger, chats_for, try_acquire, OWNER_CHAT_IDS, FULL_READ_COST
 
 # NOTE: THIS IS A TEMPLATE. 
 # You need to put your actual TELEGRAM_BOT_TOKEN here or in an env variable.
-BOT_TOKEN = "7686254070:AAFPbl9LgLIMF_mIB8KDi1ScoEByD8Uc1V4"
+BOT_TOKEN = os.environ.get("BOT_TOKEN", "7686254070:AAFPbl9LgLIMF_mIB8KDi1ScoEByD8Uc1V4")
 
 # Configure logging
 logging.basicConfig(
@@ -14,82 +30,510 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+# Reply for chats that are not on the default ledger and have not set their own
+NEEDS_SHEET = "📄 Primero configura tu hoja de Google Sheets con /hoja <id o URL>."
+SHEET_TAKEN = "⛔ Esa hoja ya la usa otro chat. Crea tu propia hoja y compártela con la cuenta de servicio."
+RATE_LIMITED = "⏳ Demasiadas consultas a Google Sheets. Intenta de nuevo en un minuto."
+
+async def acquire(context: ContextTypes.DEFAULT_TYPE, chat_id, cost=1):
+    """
+    Charge Sheets requests to the chat's budget (tenants.try_acquire), so one busy
+    chat can't exhaust the shared quota. Tells the chat when it is over.
+    """
+    if try_acquire(chat_id, cost):
+        return True
+    await context.bot.send_message(chat_id=chat_id, text=RATE_LIMITED)
+    return False
+
+@profiled("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    register_chat(chat_id)
+    schedule_digest(context.job_queue, chat_id)
     await context.bot.send_message(
-        chat_id=update.effective_chat.id,
+        chat_id=chat_id,
         text="👋 Hola! Soy tu bot de Finanzas. Te avisaré cuando haya gastos sin clasificar (como Yapes)."
     )
 
+@profiled("set_sheet")
+async def set_sheet(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/hoja <id o URL>: route this chat to its own Google Sheet (/hoja sola = hoja por defecto)."""
+    chat_id = update.effective_chat.id
+    register_chat(chat_id)
+    if not context.args:
+        if chat_id not in OWNER_CHAT_IDS:
+            await update.message.reply_text("Uso: /hoja <id o URL de tu Google Sheet>")
+            return
+        set_spreadsheet(chat_id, None)
+        await update.message.reply_text("📄 Usando la hoja por defecto.")
+        return
+
+    import re
+    arg = context.args[0]
+    match = re.search(r'/spreadsheets/d/([a-zA-Z0-9-_]+)', arg)
+    spreadsheet_id = match.group(1) if match else arg
+
+    # The service account can open the owner's ledger and every tenant's sheet:
+    # being able to open it is not enough to be allowed to use it
+    taken = any(c != chat_id for c in chats_for(spreadsheet_id))
+    if taken or (chat_id not in OWNER_CHAT_IDS and spreadsheet_id == await asyncio.to_thread(default_spreadsheet_id)):
+        await update.message.reply_text(SHEET_TAKEN)
+        return
+
+    if not await acquire(context, chat_id):
+        return
+    if not await asyncio.to_thread(warm_up, spreadsheet_id=spreadsheet_id):
+        await update.message.reply_text("❌ No pude abrir esa hoja. Compártela como EDITOR con el email de la cuenta de servicio.")
+        return
+
+    if not claim_spreadsheet(chat_id, spreadsheet_id):
+        await update.message.reply_text(SHEET_TAKEN)
+        return
+    await update.message.reply_text("✅ Hoja configurada. Tus gastos se guardarán ahí.")
+
+# --- BUDGETS ---
+# The bot owns the budget totals. Ledgers with budgets are rebuilt in the background
+# when their data version changes, so rows added or classified elsewhere (dashboard,
+# by hand) are counted and their threshold alerts still go out.
+BUDGET_SYNC_INTERVAL = int(os.environ.get("BUDGET_SYNC_INTERVAL", 300))  # seconds
+
+async def send_budget_alerts(context: ContextTypes.DEFAULT_TYPE, chat_id, spreadsheet_id):
+    """Send the threshold alerts queued by the last write (see budgets.py)."""
+    for alert in budgets.pop_alerts(spreadsheet_id):
+        await context.bot.send_message(chat_id=chat_id, text=alert, parse_mode='Markdown')
+
+async def sync_budgets(spreadsheet_id, data_version=None):
+    """Rebuild a ledger's totals from Sheets plus the rows still in the outbox."""
+    from db import get_transactions_df
+    budgets.begin_rebuild(spreadsheet_id)
+    try:
+        with span("fetch"):
+            if data_version is None:
+                data_version = await asyncio.to_thread(get_data_version, spreadsheet_id=spreadsheet_id)
+            # Outbox first: a row acked after this is already in the read below
+            queued = outbox.rows_for(spreadsheet_id)
+            df = await asyncio.to_thread(get_transactions_df, spreadsheet_id=spreadsheet_id)
+        with span("transform"):
+            await asyncio.to_thread(budgets.rebuild, spreadsheet_id, df, data_version, queued)
+        return len(df)
+    finally:
+        budgets.end_rebuild(spreadsheet_id)
+
+def schedule_budget_sync(job_queue):
+    """Start the repeating job that keeps budget totals in step with Sheets."""
+    if job_queue is None:
+        return
+    # First run right away: after a restart totals are not built and inserts are not
+    # counted (nor alerted) until they are
+    job_queue.run_repeating(resync_budgets, interval=BUDGET_SYNC_INTERVAL, first=0, name="budget_sync")
+
+@profiled("budget_sync")
+async def resync_budgets(context: ContextTypes.DEFAULT_TYPE):
+    """Rebuild the ledgers with budgets whose data changed and send the new alerts."""
+    for spreadsheet_id in budgets.ledgers():
+        try:
+            with span("fetch"):
+                data_version = await asyncio.to_thread(get_data_version, spreadsheet_id=spreadsheet_id)
+            if data_version and data_version == budgets.synced_version(spreadsheet_id):
+                continue
+            await sync_budgets(spreadsheet_id, data_version)
+        except Exception as e:
+            print(f"Budget sync failed for {spreadsheet_id or 'default ledger'}: {e}")
+            continue
+        alerts = budgets.pop_alerts(spreadsheet_id)
+        for chat_id in chats_for(spreadsheet_id):
+            for alert in alerts:
+                await context.bot.send_message(chat_id=chat_id, text=alert, parse_mode='Markdown')
+
+@profiled("budget")
+async def budget(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /presupuesto                     -> status of this month
+    /presupuesto <Categoría> <monto> -> set a monthly budget (0 removes it)
+    /presupuesto recalcular          -> rebuild the totals from the ledger
+    """
+    chat_id = update.effective_chat.id
+    if not has_ledger(chat_id):
+        await update.message.reply_text(NEEDS_SHEET)
+        return
+    spreadsheet_id = get_spreadsheet(chat_id)
+    args = context.args or []
+
+    recalculate = bool(args) and args[0].lower() == "recalcular"
+    if recalculate or (not budgets.is_built(spreadsheet_id) and (len(args) == 2 or budgets.has_budgets(spreadsheet_id))):
+        # One full read to index the ledger; after this totals are kept incrementally
+        if not await acquire(context, chat_id, 1 + FULL_READ_COST):
+            return
+        count = await sync_budgets(spreadsheet_id)
+        await send_budget_alerts(context, chat_id, spreadsheet_id)
+        if recalculate:
+            await update.message.reply_text(f"🔄 Totales recalculados ({count} movimientos).")
+            return
+
+    if len(args) == 2:
+        cats = {c.casefold(): c for c in get_categories()}
+        category = cats.get(args[0].casefold())
+        try:
+            amount = float(args[1])
+        except ValueError:
+            amount = None
+        if category is None or amount is None:
+            await update.message.reply_text(f"Uso: /presupuesto <Categoría> <monto>\nCategorías: {', '.join(get_categories())}")
+            return
+        with span("write"):
+            await asyncio.to_thread(budgets.set_budget, spreadsheet_id, category, amount)
+        await update.message.reply_text(f"✅ Presupuesto de {category}: S/ {amount:,.2f} al mes.")
+        return
+
+    from datetime import datetime
+    month_key = datetime.now().strftime('%Y-%m')
+    rows = budgets.status(spreadsheet_id, month_key)
+    if not rows:
+        await update.message.reply_text("No tienes presupuestos. Usa /presupuesto <Categoría> <monto>.")
+        return
+    lines = [f"📊 **Presupuestos {month_key}**"]
+    for category, spent, limit in rows:
+        icon = "🚨" if spent >= limit else ("⚠️" if spent >= 0.8 * limit else "✅")
+        lines.append(f"{icon} {category}: S/ {spent / 100:,.2f} / S/ {limit / 100:,.2f} ({spent * 100 // limit}%)")
+    await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+# --- SUBSCRIPTIONS ---
+@profiled("subscriptions")
+async def subscriptions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/suscripciones: recurring charges detected in the ledger."""
+    from db import get_transactions_df
+    import analysis
+
+    if not has_ledger(update.effective_chat.id):
+        await update.message.reply_text(NEEDS_SHEET)
+        return
+    chat_id = update.effective_chat.id
+    spreadsheet_id = get_spreadsheet(chat_id)
+    cached = context.bot_data.get(('subscriptions', spreadsheet_id))
+    if not await acquire(context, chat_id):
+        return
+    with span("fetch"):
+        data_version = await asyncio.to_thread(get_data_version, spreadsheet_id=spreadsheet_id)
+    if cached and data_version and cached[0] == data_version:
+        subs = cached[1]
+    else:
+        if not await acquire(context, chat_id, FULL_READ_COST):
+            return
+        with span("fetch"):
+            df = await asyncio.to_thread(get_transactions_df, spreadsheet_id=spreadsheet_id)
+        with span("transform"):
+            subs = analysis.recurring(df, ledger=spreadsheet_id, data_version=data_version)
+        context.bot_data[('subscriptions', spreadsheet_id)] = (data_version, subs)
+
+    if subs.empty:
+        await update.message.reply_text("🔁 No encontré cargos recurrentes todavía.")
+        return
+
+    lines = [f"🔁 **Cargos recurrentes** (≈ S/ {subs['monthly_cost'].sum():,.2f} al mes)"]
+    for sub in subs.head(15).itertuples():
+        lines.append(
+            f"• {sub.description} ({sub.source}): S/ {sub.amount:,.2f} {sub.period}, "
+            f"próximo ~{sub.next_date:%d/%m}"
+        )
+    with span("send"):
+        await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+# --- SEARCH ---
+@profiled("search")
+async def find(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/buscar <texto> [>monto] [<monto] [AAAA-MM]: look up past transactions."""
+    if not context.args:
+        await update.message.reply_text("Uso: /buscar <texto> [>50] [<100] [2026-10]")
+        return
+    if not has_ledger(update.effective_chat.id):
+        await update.message.reply_text(NEEDS_SHEET)
+        return
+
+    chat_id = update.effective_chat.id
+    spreadsheet_id = get_spreadsheet(chat_id)
+    if not await acquire(context, chat_id):
+        return
+    with span("fetch"):
+        data_version = await asyncio.to_thread(get_data_version, spreadsheet_id=spreadsheet_id)
+    if not search.is_synced(spreadsheet_id, data_version, last_written_version(spreadsheet_id=spreadsheet_id)):
+        # Index what changed in Sheets since the last sync (the whole ledger the first
+        # time). Our own writes are indexed as they happen and don't need one.
+        if not await acquire(context, chat_id, FULL_READ_COST):
+            return
+        from db import get_transactions_df
+        with span("fetch"):
+            df = await asyncio.to_thread(get_transactions_df, spreadsheet_id=spreadsheet_id)
+        with span("transform"):
+            await asyncio.to_thread(search.sync, spreadsheet_id, df, data_version)
+
+    text, filters = search.parse_query(context.args)
+    with span("transform"):
+        results = search.query(spreadsheet_id, text, limit=15, **filters)
+
+    if not results:
+        await update.message.reply_text("🔎 Sin resultados.")
+        return
+    lines = [f"🔎 **{len(results)} resultado(s)**"]
+    for r in results:
+        lines.append(f"• {r['date'][:10]} - {r['description']} - S/ {r['amount']:,.2f} ({r['category']}, {r['source']})")
+    with span("send"):
+        await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+# --- PENDING DIGEST ---
+# Every registered chat gets a repeating job that checks for pending items (from the
+# read-your-writes cache, or a narrow id + status read) and only sends a message
+# when there is something new since the last digest.
+DIGEST_INTERVAL = int(os.environ.get("DIGEST_INTERVAL", 600))  # seconds
+DIGEST_DEBOUNCE = int(os.environ.get("DIGEST_DEBOUNCE", 5))    # seconds after a new message
+DIGEST_MAX_ITEMS = 50
+
+def schedule_digest(job_queue, chat_id):
+    """Start the repeating digest job for a chat (once)."""
+    if job_queue is None:
+        print("Warning: JobQueue not available. Install python-telegram-bot[job-queue].")
+        return
+    name = f"digest_{chat_id}"
+    if job_queue.get_jobs_by_name(name):
+        return
+    job_queue.run_repeating(check_pending_transactions, interval=DIGEST_INTERVAL, first=DIGEST_DEBOUNCE, chat_id=chat_id, name=name)
+
+def trigger_digest(job_queue, chat_id):
+    """Run the digest soon. Bursts of messages collapse into a single run."""
+    if job_queue is None:
+        return
+    name = f"digest_now_{chat_id}"
+    if job_queue.get_jobs_by_name(name):
+        return
+    job_queue.run_once(check_pending_transactions, when=DIGEST_DEBOUNCE, chat_id=chat_id, name=name)
+
+# --- OUTBOX REPLAYER ---
+# New transactions are journaled locally (outbox.py) and acknowledged right away.
+# This job drains the journal to Sheets in batches, off the event loop.
+OUTBOX_INTERVAL = int(os.environ.get("OUTBOX_INTERVAL", 30))  # seconds
+
+def schedule_outbox(job_queue):
+    """Start the repeating outbox replayer (once)."""
+    if job_queue is None or job_queue.get_jobs_by_name("outbox"):
+        return
+    job_queue.run_repeating(flush_outbox, interval=OUTBOX_INTERVAL, first=0, name="outbox")
+
+def trigger_outbox(job_queue):
+    """Drain the outbox now. Concurrent triggers collapse into one run."""
+    if job_queue is None or job_queue.get_jobs_by_name("outbox_now"):
+        return
+    job_queue.run_once(flush_outbox, when=0, name="outbox_now")
+
+@profiled("flush_outbox")
+async def flush_outbox(context: ContextTypes.DEFAULT_TYPE):
+    with span("write"):
+        written = await asyncio.to_thread(outbox.drain)
+    # Rows are in Sheets now: prompt the chats that sent them
+    for chat_id in {e["chat_id"] for e in written if e["chat_id"] is not None}:
+        trigger_digest(context.job_queue, chat_id)
+
+# --- LEDGER CACHE REFRESH ---
+# Bounded staleness for the read-your-writes cache (ledger_cache.py): reconcile every
+# cached ledger with Sheets in the background, so writes made elsewhere show up.
+def schedule_cache_refresh(job_queue):
+    """Start the repeating cache reconcile job (once)."""
+    if job_queue is None or job_queue.get_jobs_by_name("ledger_cache"):
+        return
+    job_queue.run_repeating(refresh_ledger_cache, interval=ledger_cache.REFRESH_INTERVAL, first=ledger_cache.REFRESH_INTERVAL, name="ledger_cache")
+
+@profiled("refresh_ledger_cache")
+async def refresh_ledger_cache(context: ContextTypes.DEFAULT_TYPE):
+    for spreadsheet_id in ledger_cache.ledgers():
+        with span("fetch"):
+            await asyncio.to_thread(refresh_pending, DIGEST_MAX_ITEMS, spreadsheet_id=spreadsheet_id)
+
+@profiled("status")
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/estado: show what is still waiting to reach Google Sheets."""
+    chat_id = update.effective_chat.id
+    waiting = outbox.pending(chat_id)
+    parked = outbox.failed(chat_id)
+    if not waiting and not parked:
+        await update.message.reply_text("✅ Todo sincronizado con Google Sheets.")
+        return
+
+    lines = [f"⏳ Pendientes de envío: {len(waiting)}", f"❌ Fallidos: {len(parked)}"]
+    for e in parked[:10]:
+        lines.append(f"• {e['row'][5]} - S/ {e['row'][4]} ({e['error']})")
+    if parked:
+        lines.append("\nUsa /reintentar para volver a intentarlo.")
+    await update.message.reply_text("\n".join(lines))
+
+@profiled("retry")
+async def retry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/reintentar: retry the entries that failed too many times."""
+    count = outbox.retry_failed(update.effective_chat.id)
+    trigger_outbox(context.job_queue)
+    await update.message.reply_text(f"🔁 Reintentando {count} gasto(s).")
+
+def _similar_key(row):
+    return str(row['description']).strip().casefold()
+
+def _render_digest_page(items, page, generation, similar=False):
+    """
+    Build text + keyboard for one pending item of the digest.
+    With similar=True the category buttons apply to every pending item with the
+    same description (batch action). Navigation buttons carry the digest
+    generation, so buttons of an older digest message can't page into a newer list.
+    """
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    row = items[page]
+    cats = get_categories()
+    similar_ids = [str(r['id']) for r in items if _similar_key(r) == _similar_key(row)]
+    token = callbacks.issue({'id': str(row['id']), 'similar': similar_ids})
+
+    action = 's' if similar else 'c'
+    buttons = [InlineKeyboardButton(c, callback_data=callbacks.encode(action, token, i)) for i, c in enumerate(cats)]
+    keyboard = [buttons[i:i + 3] for i in range(0, len(buttons), 3)]
+
+    if similar:
+        keyboard.append([InlineKeyboardButton("↩️ Solo este", callback_data=callbacks.encode('p', '', page, generation))])
+    elif len(similar_ids) > 1:
+        keyboard.append([InlineKeyboardButton(f"📦 Clasificar similares ({len(similar_ids)})", callback_data=callbacks.encode('m', '', page, generation))])
+
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀️", callback_data=callbacks.encode('p', '', page - 1, generation)))
+    if page < len(items) - 1:
+        nav.append(InlineKeyboardButton("▶️", callback_data=callbacks.encode('p', '', page + 1, generation)))
+    if nav and not similar:
+        keyboard.append(nav)
+
+    msg = (
+        f"⚠️ **{len(items)} gasto(s) sin clasificar** ({page + 1}/{len(items)})\n\n"
+        f"💰 **S/ {row['amount']}**\n📅 {row['date']}\n📝 {row['description']}\nℹ️ Fuente: {row['source']}"
+    )
+    if similar:
+        msg += f"\n\n📦 Elige la categoría para los {len(similar_ids)} gastos similares."
+    return msg, InlineKeyboardMarkup(keyboard)
+
+@profiled("check_pending_transactions")
 async def check_pending_transactions(context: ContextTypes.DEFAULT_TYPE, chat_id=None):
-    """Scheduled job to check DB for unclassified items."""
+    """Digest job: coalesce the chat's pending items into a single paged message."""
+    # We allow passing chat_id explicitly or getting it from the job (scheduled)
+    if chat_id is None and context.job:
+        chat_id = context.job.chat_id
+
+    if chat_id is None:
+        print("Warning: No chat_id found for checking transactions.")
+        return
+    if not has_ledger(chat_id):
+        return
+
+    # Per-tenant budget: a chat over its Sheets quota just waits for the next run
+    if not try_acquire(chat_id):
+        print(f"Digest for {chat_id} skipped: over its request budget.")
+        return
+
     try:
-        df = get_transactions_df()
-        
-        if df is None or df.empty:
-            print("No transactions found or error fetching data")
+        # Sheets calls run in a worker thread so a slow tenant doesn't stall the others
+        spreadsheet_id = get_spreadsheet(chat_id)
+        state = context.chat_data.setdefault('digest', {'announced': set(), 'items': []})
+
+        # Read-your-writes cache: right after this process appended or classified rows
+        # this needs no Sheets call; otherwise a version check, then the narrow reads
+        with span("fetch"):
+            snapshot = await asyncio.to_thread(get_pending_snapshot, DIGEST_MAX_ITEMS, spreadsheet_id=spreadsheet_id)
+        if snapshot is None:
+            print("Error fetching pending ids")
             return
-            
-        pending = df[df['status'] == 'pending_classification']
-        
-        # In a real app, you'd store the user's chat_id in the DB or config.
-        # We allow passing chat_id explicitly (from manual message) or getting it from job (scheduled)
-        if chat_id is None and context.job:
-            chat_id = context.job.chat_id
-        
-        if chat_id is None:
-            print("Warning: No chat_id found for checking transactions.")
+        pending_ids, items = snapshot
+
+        # Nothing new since the last digest: no message
+        if not set(pending_ids) - state['announced']:
+            state['announced'] &= set(pending_ids)
             return
-        
-        for index, row in pending.iterrows():
-            # Create buttons for categories
-            cats = get_categories()
-            # Limit to first 4 for UI simplicity + "Other"
-            keyboard = [
-                [InlineKeyboardButton(c, callback_data=f"cat_{row['id']}_{c}") for c in cats[:3]],
-                [InlineKeyboardButton(c, callback_data=f"cat_{row['id']}_{c}") for c in cats[3:6]]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            msg = f"⚠️ **Gasto sin clasificar**\n\n💰 **S/ {row['amount']}**\n📅 {row['date']}\n📝 {row['description']}\nℹ️ Fuente: {row['source']}"
-            
+        if not items:
+            return
+
+        state['items'] = items
+        state['announced'] = set(pending_ids)
+        state['generation'] = state.get('generation', 0) + 1
+
+        with span("render"):
+            msg, reply_markup = _render_digest_page(items, 0, state['generation'])
+        with span("send"):
             await context.bot.send_message(chat_id=chat_id, text=msg, reply_markup=reply_markup, parse_mode='Markdown')
-            
-            # Don't spam, maybe just 1 at a time or create a queue mechanism. 
-            # For prototype, we break after 1 to verify flow.
-            break
     except Exception as e:
         print(f"Error in check_pending_transactions: {e}")
         import traceback
         traceback.print_exc()
-        if chat_id:
-            try:
-                await context.bot.send_message(chat_id=chat_id, text=f"⚠️ Error al buscar gastos pendientes:\n{str(e)}")
-            except:
-                pass
+        try:
+            await context.bot.send_message(chat_id=chat_id, text=f"⚠️ Error al buscar gastos pendientes:\n{str(e)}")
+        except:
+            pass
 
 
+@profiled("button_handler")
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    
-    data = query.data
-    # format: cat_{id}_{category}
-    parts = data.split('_')
-    if len(parts) >= 3 and parts[0] == 'cat':
-        tx_id = parts[1]
-        category = parts[2]
-        
-        # Update DB
-        
-        if update_transaction_category(tx_id, category):
-            await query.edit_message_text(text=f"✅ Clasificado como: **{category}**")
+
+    # format: <action>:<token>[:<arg>] (see callbacks.py)
+    action, payload, args = callbacks.decode(query.data)
+    state = context.chat_data.get('digest', {'announced': set(), 'items': []})
+    items = state['items']
+
+    # p = go to page, m = show the "classify similar" keyboard for a page
+    if action in ('p', 'm'):
+        # args: page, digest generation (buttons of a replaced digest are stale)
+        current = len(args) == 2 and args[1] == str(state.get('generation'))
+        page = int(args[0]) if current and args[0].isdigit() else -1
+        if 0 <= page < len(items):
+            msg, reply_markup = _render_digest_page(items, page, state['generation'], similar=(action == 'm'))
+            await query.edit_message_text(text=msg, reply_markup=reply_markup, parse_mode='Markdown')
         else:
+            await query.edit_message_text(text="ℹ️ Este resumen ya no está vigente.")
+        return
+
+    # c = classify one item, s = classify the item and all similar pending items
+    if action in ('c', 's'):
+        cats = get_categories()
+        if payload is None or not args or not args[0].isdigit() or int(args[0]) >= len(cats):
+            await query.edit_message_text(text="ℹ️ Este botón expiró. Espera el próximo resumen.")
+            return
+
+        category = cats[int(args[0])]
+        tx_ids = payload['similar'] if action == 's' else [payload['id']]
+        if not has_ledger(update.effective_chat.id):
+            await query.edit_message_text(text=NEEDS_SHEET)
+            return
+        if not await acquire(context, update.effective_chat.id):
+            return
+
+        # Update DB (in the chat's own spreadsheet)
+        spreadsheet_id = get_spreadsheet(update.effective_chat.id)
+        with span("write"):
+            if len(tx_ids) == 1:
+                ok = await asyncio.to_thread(update_transaction_category, tx_ids[0], category, spreadsheet_id=spreadsheet_id)
+            else:
+                ok = await asyncio.to_thread(update_transactions_category, tx_ids, category, spreadsheet_id=spreadsheet_id)
+        if not ok:
             await query.edit_message_text(text=f"❌ Error al actualizar Google Sheets. Revisa la terminal del bot.")
+            return
+
+        await send_budget_alerts(context, update.effective_chat.id, spreadsheet_id)
+
+        # Drop the items from the digest and move on to the next one
+        done = set(tx_ids)
+        state['items'] = items = [r for r in items if str(r['id']) not in done]
+        label = f"✅ Clasificado como: **{category}**" if len(tx_ids) == 1 else f"✅ {len(tx_ids)} gastos clasificados como: **{category}**"
+        if items:
+            with span("render"):
+                msg, reply_markup = _render_digest_page(items, 0, state['generation'])
+            with span("send"):
+                await query.edit_message_text(text=f"{label}\n\n{msg}", reply_markup=reply_markup, parse_mode='Markdown')
+        else:
+            with span("send"):
+                await query.edit_message_text(text=label, parse_mode='Markdown')
 
 # --- MINIMAL HTTP SERVER FOR RENDER ---
 from flask import Flask
 from threading import Thread
-import os
 
 app = Flask(__name__)
 
@@ -101,6 +545,67 @@ def home():
 def health():
     return "OK", 200
 
+@app.route('/perf')
+def perf():
+    """Latency histograms per handler/stage (enable with PROFILING=1)."""
+    return report(), 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+# Streaming exports (see export.py). Disabled unless EXPORT_TOKEN is set, since the
+# health port is public on Render.
+EXPORT_TOKEN = os.environ.get("EXPORT_TOKEN")
+
+def _export_slice():
+    """Ledger and slice from the query string: chat (or sheet), year, month (repeatable or a,b), category."""
+    from flask import request
+    args = request.args
+    if args.get("chat"):
+        if not has_ledger(int(args["chat"])):
+            raise ValueError("That chat has no spreadsheet configured")
+        spreadsheet_id = get_spreadsheet(int(args["chat"]))
+    else:
+        spreadsheet_id = args.get("sheet") or None
+    months = [m for value in args.getlist("month") for m in value.split(",") if m]
+    return spreadsheet_id, args.get("year"), months, args.get("category")
+
+def _export_authorized():
+    """Authorization: Bearer <EXPORT_TOKEN>. Never from the query string (it ends up in access logs)."""
+    from flask import request
+    import hmac
+    given = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return bool(EXPORT_TOKEN) and hmac.compare_digest(given, EXPORT_TOKEN)
+
+@app.route('/export')
+def export_report():
+    """
+    /export?format=csv|parquet|xlsx&year=2026&month=10&category=Comida&chat=<chat_id>
+    Streams the slice in chunks; runs in the HTTP server thread, not on the bot's event loop.
+    """
+    from flask import Response, request
+    import export
+    if not _export_authorized():
+        return "Forbidden", 403
+    try:
+        spreadsheet_id, year, months, category = _export_slice()
+        result = export.stream(request.args.get("format", "csv"), spreadsheet_id, year, months, category)
+    except ValueError as e:
+        return str(e), 400
+    if result is None:
+        return "Too many exports running, try again shortly.", 429, {"Retry-After": "30"}
+    return Response(result, content_type=result.content_type,
+                    headers={"Content-Disposition": f'attachment; filename="{result.filename}"'})
+
+@app.route('/export/summary')
+def export_summary():
+    """Monthly totals by category and daily series for the same slice, as JSON."""
+    from flask import jsonify
+    import export
+    if not _export_authorized():
+        return "Forbidden", 403
+    try:
+        return jsonify(export.summary(*_export_slice()))
+    except ValueError as e:
+        return str(e), 400
+
 def run_server():
     port = int(os.environ.get("PORT", 8080))
     app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
@@ -111,10 +616,16 @@ def start_server():
 # ---------------------------------------
 
 
+@profiled("handle_message")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages as new pending transactions."""
     text = update.message.text
     chat_id = update.effective_chat.id
+    if not has_ledger(chat_id):
+        # Not the owner and no /hoja yet: never write into the owner's ledger
+        register_chat(chat_id)
+        await update.message.reply_text(NEEDS_SHEET)
+        return
     
     import re
     amounts = re.findall(r'\d+(?:\.\d+)?', text)
@@ -134,12 +645,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     description = description.strip(" .-,")
     if not description: description = "Gasto General" # Double check
     
-    from db import add_transaction
+    from db import new_transaction_row
     from datetime import datetime
     
-    # Try to save the transaction and notify user of result
+    # Journal the transaction locally (fsync'd) and acknowledge right away.
+    # The outbox replayer writes it to Google Sheets in the background, to the
+    # ledger the chat uses now (the same one budgets and search count it under).
+    spreadsheet_id = get_spreadsheet(chat_id)
     try:
-        add_transaction(
+        row = new_transaction_row(
             date=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             amount=amount,
             description=description,
@@ -147,18 +661,29 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             category="Otros",
             status="pending_classification"
         )
-        
-        # Send success confirmation
-        await update.message.reply_text(f"✅ Registrado: {description} - S/ {amount}\nEsperando clasificación...")
-        
-        # Trigger the classification flow immediately
-        await check_pending_transactions(context, chat_id=chat_id)
-        
+        with span("write"):
+            outbox.enqueue(row, chat_id=chat_id, spreadsheet_id=spreadsheet_id)
     except Exception as e:
         # Send error notification
-        error_msg = f"❌ ERROR: No pude guardar '{description} - S/ {amount}'\n\nDetalles: {str(e)}\n\nRevisa:\n• Google Sheets\n• Credenciales\n• Logs de Render"
+        error_msg = f"❌ ERROR: No pude guardar '{description} - S/ {amount}'\n\nDetalles: {str(e)}\n\nRevisa:\n• Disco local\n• Logs de Render"
         await update.message.reply_text(error_msg)
         print(f"Error saving transaction: {e}")
+        return
+
+    # Send success confirmation
+    with span("send"):
+        await update.message.reply_text(f"✅ Registrado: {description} - S/ {amount}\nEsperando clasificación...")
+
+    # Count it against the monthly budget right away (the outbox append later is a no-op).
+    # In memory only, O(1): nothing is written to disk here
+    budgets.record_insert(spreadsheet_id, row)
+    search.index_row(spreadsheet_id, row)
+    await send_budget_alerts(context, chat_id, spreadsheet_id)
+
+    # Sync to Sheets; the classification prompt follows once the row is there
+    register_chat(chat_id)
+    schedule_digest(context.job_queue, chat_id)
+    trigger_outbox(context.job_queue)
     
     # Acknowledge (commented out since we now have explicit confirmations above)
     # await update.message.reply_text(f"📝 Gasto registrado: S/ {amount}. Clasifícalo arriba 👆")
@@ -167,22 +692,38 @@ if __name__ == '__main__':
     if BOT_TOKEN == "YOUR_TOKEN_HERE":
         print("⚠️ ERROR: Debes poner tu Token de Telegram en boto.py para que funcione.")
     else:
+        # Open the health port first so Render sees the service as up right away,
+        # then connect to Sheets in the background while the bot is being built.
+        start_server()
+        if not OWNER_CHAT_IDS:
+            print("⚠️ OWNER_CHAT_ID is not set: no chat can use the default ledger until it is.")
+        print(f"HTTP server started on port {os.environ.get('PORT', 8080)} ({time.perf_counter() - _STARTED_AT:.2f}s after start)")
+        Thread(target=warm_up, daemon=True).start()
+
+        from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters
         application = ApplicationBuilder().token(BOT_TOKEN).build()
         
         application.add_handler(CommandHandler('start', start))
+        application.add_handler(CommandHandler('hoja', set_sheet))
+        application.add_handler(CommandHandler('estado', status))
+        application.add_handler(CommandHandler('presupuesto', budget))
+        application.add_handler(CommandHandler('suscripciones', subscriptions))
+        application.add_handler(CommandHandler('buscar', find))
+        application.add_handler(CommandHandler('reintentar', retry))
         application.add_handler(CallbackQueryHandler(button_handler))
         
         # New: Handle text messages
-        from telegram.ext import MessageHandler, filters
         application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message))
         
-        # Note: in a real deployment we would use JobQueue to check periodically.
-        # For testing, you can trigger 'check' commands manually or run a loop.
-        
-        print("Bot iniciado...")
+        # Replay anything left in the outbox and keep draining it
+        schedule_outbox(application.job_queue)
+        schedule_cache_refresh(application.job_queue)
+        schedule_budget_sync(application.job_queue)
+
+        # Periodic pending digest for every chat we already know
+        for known_chat in load_chats():
+            schedule_digest(application.job_queue, known_chat)
         
-        # Start HTTP server for Render keep-alive
-        start_server()
-        print("HTTP server started on port", os.environ.get("PORT", 8080))
+        print(f"Bot iniciado... ({time.perf_counter() - _STARTED_AT:.2f}s after start)")
         
         application.run_polling()
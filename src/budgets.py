@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+
+# Per-category monthly budgets with running totals.
+#
+# Totals are kept per ledger (spreadsheet) and month in integer cents, and are
+# updated incrementally on every insert and category change (the db write paths
+# call record_insert / record_category_change). A small index txn_id -> (month,
+# category, cents) lets a category change move the amount between categories
+# without re-reading the ledger. rebuild() recomputes everything from raw rows and
+# gives exactly the same numbers.
+#
+# Only the budgets themselves are saved to BUDGETS_FILE (a few bytes per category).
+# Totals and the txn index live in memory: they are built on demand by rebuild() and
+# writes to a ledger that was not built in this process are left for that rebuild,
+# so an insert costs a few dict operations whatever the ledger size.
+#
+# Other processes (the dashboard) and edits by hand change the ledger behind our
+# back: the bot rebuilds ledgers with budgets when their data version changes,
+# replaying the writes it recorded while the rebuild was reading.
+#
+# Crossing a threshold (80%, 100%) queues an alert; the bot sends them with pop_alerts().
+
+BUDGETS_FILE = os.environ.get(
+    "BUDGETS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "budgets.json")
+)
+THRESHOLDS = [0.8, 1.0]
+DEFAULT_LEDGER = "default"
+
+_lock = threading.Lock()
+_state = None   # ledger -> {"budgets": {cat: cents}, "totals": {month: {cat: cents}}, "txns": {id: [month, cat, cents]}, "built": bool, "version": int}
+_alerts = {}    # ledger -> [alert text]
+_replay = {}    # ledger -> writes recorded while a rebuild reads the ledger
+
+def _key(spreadsheet_id):
+    return spreadsheet_id or DEFAULT_LEDGER
+
+def _cents(amount):
+    try:
+        return int(round(float(amount) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+def _month(year, month):
+    """'YYYY-MM' from the year/month columns, or None if unknown."""
+    year, month = str(year), str(month).zfill(2)
+    if not (year.isdigit() and month.isdigit()):
+        return None
+    return f"{year}-{month}"
+
+def _load():
+    global _state
+    if _state is not None:
+        return
+    _state = {}
+    if os.path.exists(BUDGETS_FILE):
+        try:
+            with open(BUDGETS_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # Older files also carried totals and the txn index: keep the budgets only
+            _state = {key: {"budgets": ledger.get("budgets", {})} for key, ledger in data.items()}
+        except Exception as e:
+            print(f"Error reading {BUDGETS_FILE}: {e}")
+
+def _save():
+    """Persist the budgets (not the totals, which are rebuilt from the ledger)."""
+    os.makedirs(os.path.dirname(BUDGETS_FILE), exist_ok=True)
+    tmp_path = BUDGETS_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({key: {"budgets": ledger["budgets"]} for key, ledger in _state.items()}, f, ensure_ascii=False)
+    os.replace(tmp_path, BUDGETS_FILE)
+
+def _ledger(spreadsheet_id):
+    _load()
+    ledger = _state.setdefault(_key(spreadsheet_id), {"budgets": {}})
+    for field in ("totals", "txns"):
+        ledger.setdefault(field, {})
+    return ledger
+
+def _alert(key, category, month, before, after, limit):
+    crossed = [t for t in THRESHOLDS if before < t * limit <= after]
+    if crossed:
+        # One alert per write, for the highest threshold crossed
+        icon = "🚨" if crossed[-1] >= 1 else "⚠️"
+        _alerts.setdefault(key, []).append(
+            f"{icon} Presupuesto de **{category}** ({month}) al {after * 100 // limit}%: "
+            f"S/ {after / 100:,.2f} de S/ {limit / 100:,.2f}"
+        )
+
+def _add(ledger, key, month, category, cents, alert=True):
+    """Apply a delta and queue alerts for thresholds crossed upwards."""
+    month_totals = ledger["totals"].setdefault(month, {})
+    before = month_totals.get(category, 0)
+    after = before + cents
+    if after:
+        month_totals[category] = after
+    else:
+        # Keep the same shape rebuild() produces
+        month_totals.pop(category, None)
+
+    limit = ledger["budgets"].get(category)
+    if alert and limit and cents > 0:
+        _alert(key, category, month, before, after, limit)
+
+def _insert(ledger, key, row, alert=True):
+    txn_id, month, year, amount, category = str(row[0]), row[2], row[3], row[4], row[6]
+    month_key = _month(year, month)
+    if month_key is None or txn_id in ledger["txns"]:
+        return
+    cents = _cents(amount)
+    ledger["txns"][txn_id] = [month_key, category, cents]
+    _add(ledger, key, month_key, category, cents, alert)
+
+def _move(ledger, key, txn_ids, category, alert=True):
+    for txn_id in txn_ids:
+        entry = ledger["txns"].get(str(txn_id))
+        if entry is None or entry[1] == category:
+            continue
+        month_key, old_category, cents = entry
+        _add(ledger, key, month_key, old_category, -cents, alert)
+        _add(ledger, key, month_key, category, cents, alert)
+        entry[1] = category
+
+def record_insert(spreadsheet_id, row):
+    """Count a new V2 row. Rows already seen (same id) are ignored."""
+    with _lock:
+        key = _key(spreadsheet_id)
+        if key in _replay:
+            _replay[key].append(("insert", row))
+        ledger = _ledger(spreadsheet_id)
+        if ledger.get("built"):
+            _insert(ledger, key, row)
+
+def record_category_change(spreadsheet_id, txn_ids, category):
+    """Move the amounts of txn_ids to `category` (no ledger read)."""
+    with _lock:
+        key = _key(spreadsheet_id)
+        if key in _replay:
+            _replay[key].append(("category", list(txn_ids), category))
+        _move(_ledger(spreadsheet_id), key, txn_ids, category)
+
+def begin_rebuild(spreadsheet_id):
+    """
+    Call before reading the ledger for rebuild(): writes recorded from now on are
+    replayed on top of what was read, so none is lost while the read is in flight.
+    """
+    with _lock:
+        _replay[_key(spreadsheet_id)] = []
+
+def end_rebuild(spreadsheet_id):
+    """Stop recording writes for replay (after rebuild(), or if the read failed)."""
+    with _lock:
+        _replay.pop(_key(spreadsheet_id), None)
+
+def rebuild(spreadsheet_id, df, data_version=None, queued_rows=()):
+    """
+    Recompute totals and the txn index from the raw ledger DataFrame read at
+    data_version, plus V2 rows not in Sheets yet (the outbox). If the ledger was
+    already built, thresholds the new totals cross (e.g. rows classified from the
+    dashboard) are queued as alerts.
+    """
+    with _lock:
+        key = _key(spreadsheet_id)
+        ledger = _ledger(spreadsheet_id)
+        old_totals = ledger["totals"] if ledger.get("built") else None
+        ledger["totals"], ledger["txns"] = {}, {}
+        for txn_id, month, year, amount, category in zip(df["id"], df["month"], df["year"], df["amount"], df["category"]):
+            month_key = _month(year, month)
+            if month_key is None:
+                continue
+            cents = _cents(amount)
+            ledger["txns"][str(txn_id)] = [month_key, category, cents]
+            month_totals = ledger["totals"].setdefault(month_key, {})
+            month_totals[category] = month_totals.get(category, 0) + cents
+        for row in queued_rows:
+            _insert(ledger, key, row, alert=False)
+        # Writes made during the read: if the ledger was built they were counted (and
+        # alerted) live; on a first build (e.g. right after a restart) they weren't
+        first_build = old_totals is None
+        for op in _replay.get(key, ()):
+            if op[0] == "insert":
+                _insert(ledger, key, op[1], alert=first_build)
+            else:
+                _move(ledger, key, op[1], op[2], alert=first_build)
+        for month_totals in ledger["totals"].values():
+            for category in [c for c, cents in month_totals.items() if not cents]:
+                del month_totals[category]
+
+        if old_totals is not None:
+            for month_key, month_totals in ledger["totals"].items():
+                for category, limit in ledger["budgets"].items():
+                    before = old_totals.get(month_key, {}).get(category, 0)
+                    _alert(key, category, month_key, before, month_totals.get(category, 0), limit)
+        ledger["built"] = True
+        ledger["version"] = data_version
+
+def set_budget(spreadsheet_id, category, amount):
+    """Set (or clear with amount <= 0) the monthly budget of a category."""
+    with _lock:
+        ledger = _ledger(spreadsheet_id)
+        if amount and amount > 0:
+            ledger["budgets"][category] = _cents(amount)
+        else:
+            ledger["budgets"].pop(category, None)
+        _save()
+
+def status(spreadsheet_id, month_key):
+    """[(category, spent_cents, budget_cents)] for the categories with a budget."""
+    with _lock:
+        ledger = _ledger(spreadsheet_id)
+        totals = ledger["totals"].get(month_key, {})
+        return [(cat, totals.get(cat, 0), limit) for cat, limit in sorted(ledger["budgets"].items())]
+
+def has_budgets(spreadsheet_id):
+    """True if the ledger has at least one budget set."""
+    with _lock:
+        return bool(_ledger(spreadsheet_id)["budgets"])
+
+def is_built(spreadsheet_id):
+    """True once the ledger has been indexed from raw data by rebuild() in this process."""
+    with _lock:
+        return bool(_ledger(spreadsheet_id).get("built"))
+
+def synced_version(spreadsheet_id):
+    """Data version the totals were last rebuilt at (None if never in this process)."""
+    with _lock:
+        return _ledger(spreadsheet_id).get("version")
+
+def ledgers():
+    """Spreadsheet ids of the ledgers with budgets (None = default ledger)."""
+    with _lock:
+        _load()
+        return [None if key == DEFAULT_LEDGER else key for key, ledger in _state.items() if ledger["budgets"]]
+
+def pop_alerts(spreadsheet_id):
+    """Return and clear the queued threshold alerts of a ledger."""
+    with _lock:
+        return _alerts.pop(_key(spreadsheet_id), [])
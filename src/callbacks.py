@@ -0,0 +1,60 @@
+import heapq
+import secrets
+import time
+
+# Compact callback_data protocol for inline buttons.
+#
+# Telegram limits callback_data to 64 bytes, so buttons never carry transaction ids
+# or category names. Instead, the payload is kept in a server-side table under a
+# short random token and the button carries "<action>:<token>[:<arg>...]",
+# e.g. "c:Xb3k9QaZ:4" = classify the item behind token Xb3k9QaZ as category #4.
+# Decoding is a split plus one dict lookup.
+
+CALLBACK_DATA_LIMIT = 64
+DEFAULT_TTL = 24 * 3600  # seconds a button stays valid
+
+_table = {}    # token -> (expires_at, payload)
+_expiry = []   # heap of (expires_at, token), so pruning only looks at expired tokens
+
+def _prune(now):
+    while _expiry and _expiry[0][0] <= now:
+        expires_at, token = heapq.heappop(_expiry)
+        entry = _table.get(token)
+        if entry is not None and entry[0] == expires_at:
+            del _table[token]
+
+def issue(payload, ttl=DEFAULT_TTL):
+    """Store payload server-side and return the short token that refers to it."""
+    now = time.time()
+    _prune(now)
+    token = secrets.token_urlsafe(6)
+    while token in _table:
+        token = secrets.token_urlsafe(6)
+    _table[token] = (now + ttl, payload)
+    heapq.heappush(_expiry, (now + ttl, token))
+    return token
+
+def resolve(token):
+    """Return the payload for token, or None if it is unknown or expired."""
+    entry = _table.get(token)
+    if entry is None:
+        return None
+    expires_at, payload = entry
+    if expires_at <= time.time():
+        del _table[token]
+        return None
+    return payload
+
+def encode(action, token="", *args):
+    """Build callback_data for an action. Raises ValueError past Telegram's limit."""
+    data = ":".join([action, token] + [str(a) for a in args])
+    if len(data.encode("utf-8")) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"callback_data too long ({len(data)} bytes): {data}")
+    return data
+
+def decode(data):
+    """Split callback_data into (action, payload, args). payload is None if expired."""
+    parts = data.split(":")
+    action = parts[0]
+    token = parts[1] if len(parts) > 1 else ""
+    return action, (resolve(token) if token else None), parts[2:]
@@ -1,9 +1,14 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from db import get_transactions_df, update_transaction_category, get_categories, add_transaction
+from db import get_transactions_df, get_data_version, update_transaction_category, update_transactions_category, get_categories, add_transaction
 from datetime import datetime
 import os
+import tempfile
+from analysis import recurring
+import export
+import search
+from profiling import request, span, report, ENABLED as PROFILING_ENABLED
 
 # Page Config
 st.set_page_config(page_title="Balance Automático", page_icon="💰", layout="wide")
@@ -12,8 +17,52 @@ st.set_page_config(page_title="Balance Automático", page_icon="💰", layout="w
 st.title("💰 Control de Gastos & Balance (Google Sheets)")
 st.caption("Conectado a: BalanceAutomaticoDB")
 
-def get_df():
-    return get_transactions_df()
+# Seconds between data version polls (0 disables auto-refresh)
+AUTO_REFRESH_SECONDS = int(os.environ.get("AUTO_REFRESH_SECONDS", 30))
+
+def get_df(force=False):
+    """Reload the ledger only when its data version changed (one single-cell read)."""
+    version = get_data_version()
+    cached = st.session_state.get("ledger")
+    if not force and cached is not None and version and cached[0] == version:
+        # The script adds columns to df, so hand out a copy of the cached frame
+        return cached[1].copy()
+    df = get_transactions_df()
+    st.session_state["ledger"] = (version, df)
+    # Tells loads at the same version apart (a forced reload after edits by hand)
+    st.session_state["ledger_loads"] = st.session_state.get("ledger_loads", 0) + 1
+    if force:
+        # Same version but possibly different rows (edits by hand don't bump it)
+        st.session_state["search_resync"] = True
+        st.session_state.pop("table_order", None)
+    return df.copy()
+
+# Transactions table: rows per page and sort orders (column, ascending)
+TABLE_PAGE_SIZES = [25, 50, 100, 200]
+TABLE_PAGE_SIZE = int(os.environ.get("TABLE_PAGE_SIZE", 50))
+SORT_OPTIONS = {
+    "Más recientes": ("date", False),
+    "Más antiguos": ("date", True),
+    "Mayor monto": ("amount", False),
+    "Menor monto": ("amount", True),
+}
+
+def table_order(df, filter_key, sort_label):
+    """
+    Row positions of df in display order. Sorted once per data version, filter and
+    sort; paging then just slices this index, so a page costs O(page size).
+    """
+    version = st.session_state.get("ledger", (None,))[0]
+    key = (version, len(df), filter_key, sort_label)
+    cached = st.session_state.get("table_order")
+    # Version 0 / None means unknown (no _meta stamp yet): the data may have changed
+    if version and cached is not None and cached[0] == key:
+        return cached[1]
+    column, ascending = SORT_OPTIONS[sort_label]
+    values = pd.to_numeric(df[column], errors="coerce") if column == "amount" else df[column].astype(str)
+    order = values.reset_index(drop=True).sort_values(ascending=ascending, kind="stable").index.to_numpy()
+    st.session_state["table_order"] = (key, order)
+    return order
 
 def add_tx(date, amount, desc, source, cat, status):
     add_transaction(date, amount, desc, source, cat, status)
@@ -25,8 +74,19 @@ def update_tx(tx_id, cat):
 # Sidebar: Actions
 st.sidebar.header("Acciones Rápidas")
 if st.sidebar.button("🔄 Recargar Datos"):
+    st.session_state["force_reload"] = True
     st.rerun()
 
+if AUTO_REFRESH_SECONDS and hasattr(st, "fragment"):
+    @st.fragment(run_every=AUTO_REFRESH_SECONDS)
+    def watch_data_version():
+        """Rerun the app when the bot (or anyone) writes to the sheet."""
+        cached = st.session_state.get("ledger")
+        if cached is not None and get_data_version() not in (0, cached[0]):
+            st.rerun()
+
+    watch_data_version()
+
 st.sidebar.divider()
 
 # Manually add transaction (Fallback)
@@ -53,136 +113,250 @@ with st.sidebar.form("manual_add"):
 
 # --- Main Content ---
 
-# 1. KPIs
-df = get_df()
-if not df.empty:
-    # Ensure columns exist
-    if 'amount' not in df.columns: df['amount'] = 0
-    if 'status' not in df.columns: df['status'] = 'pending_classification'
-    if 'month' not in df.columns: df['month'] = "Desconocido"
-    if 'year' not in df.columns: df['year'] = "Desconocido"
-
-    # --- sidebar filters ---
-    st.sidebar.header("Filtros")
-    
-    # Year Filter
-    available_years = sorted(list(set(df['year'].astype(str))))
-    selected_year = st.sidebar.selectbox("Año", available_years, index=len(available_years)-1 if available_years else 0)
-    
-    # Month Filter
-    available_months = sorted(list(set(df[df['year'].astype(str) == selected_year]['month'].astype(str))))
-    selected_month = st.sidebar.multiselect("Mes", available_months, default=available_months)
-    
-    # Apply filters
-    if selected_month:
-        df_filtered = df[ (df['year'].astype(str) == selected_year) & (df['month'].astype(str).isin(selected_month)) ]
-    else:
-        df_filtered = df[df['year'].astype(str) == selected_year]
-    
-    # KPI Calculations based on filtered data
-    total_spent = df_filtered['amount'].sum()
-    pending_tx = df_filtered[df_filtered['status'] == 'pending_classification'].shape[0]
-    avg_tx = df_filtered['amount'].mean() if len(df_filtered) > 0 else 0
-
-    col1, col2, col3 = st.columns(3)
-    col1.metric("Gasto Total", f"S/ {total_spent:,.2f}")
-    col2.metric("Pendientes", f"{pending_tx}", delta_color="inverse")
-    col3.metric("Promedio por Gasto", f"S/ {avg_tx:,.2f}")
-
-    st.divider()
+with request("dashboard"):
+    # 1. KPIs
+    with span("fetch"):
+        df = get_df(force=st.session_state.pop("force_reload", False))
+    if not df.empty:
+        # Ensure columns exist
+        if 'amount' not in df.columns: df['amount'] = 0
+        if 'status' not in df.columns: df['status'] = 'pending_classification'
+        if 'month' not in df.columns: df['month'] = "Desconocido"
+        if 'year' not in df.columns: df['year'] = "Desconocido"
 
-    # 2. Editable Data Table
-    st.subheader("📋 Movimientos Recientes")
-    st.info("Edita la categoría o descripción directamente en la tabla.")
-    
-    # Prepare dataframe for editor
-    # We allow editing: description, category, status
-    # We hide ID but keep it for index
-    
-    valid_categories = get_categories()
-    
-    edited_df = st.data_editor(
-        df_filtered, # Use filtered data for the table
-        column_config={
-            "category": st.column_config.SelectboxColumn(
-                "Categoría",
-                help="Clasifícalo",
-                width="medium",
-                options=valid_categories,
-                required=True,
-            ),
-            "amount": st.column_config.NumberColumn(
-                "Monto",
-                format="S/ %.2f"
-            ),
-            "status": st.column_config.SelectboxColumn(
-                "Estado",
-                options=["verified", "pending_classification"],
-                disabled=True 
-            )
-        },
-        disabled=["id", "date", "source", "month", "year"], # Prevent editing generic fields
-        hide_index=True,
-        use_container_width=True,
-        num_rows="dynamic",
-        key="editor"
-    )
-
-    # Detect changes
-    # Streamlit data_editor returns the state. We need to check if categories changed.
-    # This acts as a 'bulk update' when the user is done editing.
-    # Note: st.data_editor updates state instantly but we need to persist to DB.
-    # A simple button to "Save Changes" is often safer for SQL consistency than auto-save on every cell
-    
-    if st.button("💾 Guardar Cambios en Tabla"):
-        # Iterate and update DB
-        # This is a naive implementation comparing the edited_df with DB relies on ID
-        pass 
-        # Actually, st.data_editor lets us see simple diffs if we used experimental features, 
-        # but for now let's just use the sidebar or rely on the visual aspect. 
-        # A true sync requires comparing rows.
+        # --- sidebar filters ---
+        st.sidebar.header("Filtros")
         
-        # Let's try an 'Auto-Save' approach on the backend? 
-        # For simplicity in this v1: We iterate the edited_df and update the DB for *all* rows 
-        # (or just check diffs if performance matters, but for personal finance < 10k rows is fine)
+        # Year Filter
+        available_years = sorted(list(set(df['year'].astype(str))))
+        selected_year = st.sidebar.selectbox("Año", available_years, index=len(available_years)-1 if available_years else 0)
         
-        progress_text = "Actualizando base de datos..."
-        my_bar = st.progress(0, text=progress_text)
+        # Month Filter
+        available_months = sorted(list(set(df[df['year'].astype(str) == selected_year]['month'].astype(str))))
+        selected_month = st.sidebar.multiselect("Mes", available_months, default=available_months)
         
-        for index, row in edited_df.iterrows():
-            # Update each row
-            # We assume ID is present and correct
-            if 'id' in row:
-                update_tx(row['id'], row['category'])
+        # Apply filters
+        with span("transform"):
+            if selected_month:
+                df_filtered = df[ (df['year'].astype(str) == selected_year) & (df['month'].astype(str).isin(selected_month)) ]
+            else:
+                df_filtered = df[df['year'].astype(str) == selected_year]
             
-        my_bar.progress(100, text="Actualizado completo!")
-        st.success("Datos sincronizados.")
-        st.rerun()
+            # KPI Calculations based on filtered data
+            total_spent = df_filtered['amount'].sum()
+            pending_tx = df_filtered[df_filtered['status'] == 'pending_classification'].shape[0]
+            avg_tx = df_filtered['amount'].mean() if len(df_filtered) > 0 else 0
 
-    st.divider()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Gasto Total", f"S/ {total_spent:,.2f}")
+        col2.metric("Pendientes", f"{pending_tx}", delta_color="inverse")
+        col3.metric("Promedio por Gasto", f"S/ {avg_tx:,.2f}")
 
-    # 3. Analytics
-    st.subheader("📊 Análisis de Gastos")
-    
-    col_chart1, col_chart2 = st.columns(2)
-    
-    with col_chart1:
-        st.markdown("**Por Categoría**")
-        cat_sum = df_filtered.groupby("category")["amount"].sum().reset_index()
-        fig_pie = px.pie(cat_sum, values='amount', names='category', hole=0.4, color_discrete_sequence=px.colors.qualitative.Pastel)
-        st.plotly_chart(fig_pie, use_container_width=True)
-
-    with col_chart2:
-        st.markdown("**Evolución Diaria (Mes Actual)**")
-        # Ensure correct type
-        # In V2, we might want to just show the days of the selected filtered view
-        try:
-             df_filtered['date_dt'] = pd.to_datetime(df_filtered['date'])
-             daily_sum = df_filtered.groupby(df_filtered['date_dt'].dt.date)["amount"].sum().reset_index()
-             fig_bar = px.bar(daily_sum, x='date_dt', y='amount', title="Gastos por Día", color_discrete_sequence=['#4B4EFC'])
-             st.plotly_chart(fig_bar, use_container_width=True)
-        except Exception as e:
-            st.error(f"Error parseando fechas: {e}")
-
-else:
-    st.warning("No hay datos aún. Usa el formulario de la izquierda o espera a que lleguen correos.")
+        st.divider()
+
+        # Search over the whole ledger (inverted index, kept in sync incrementally)
+        search_text = st.text_input("🔎 Buscar", placeholder="netflix >20 2026-10", help="Texto (prefijos, sin tildes), >monto, <monto, AAAA-MM")
+        if search_text.strip():
+            with span("transform"):
+                version = st.session_state.get("ledger", (None,))[0]
+                if st.session_state.pop("search_resync", False) or not search.is_synced(None, version):
+                    search.sync(None, df, data_version=version)
+                text, filters = search.parse_query(search_text.split())
+                results = search.query(None, text, limit=200, **filters)
+            if results:
+                st.dataframe(
+                    pd.DataFrame(results)[["date", "description", "amount", "category", "source"]],
+                    column_config={"amount": st.column_config.NumberColumn("Monto", format="S/ %.2f")},
+                    hide_index=True,
+                    use_container_width=True,
+                )
+            else:
+                st.caption("Sin resultados.")
+            st.divider()
+
+        # 2. Editable Data Table (paged: only the visible window is sent to the browser)
+        st.subheader("📋 Movimientos Recientes")
+        st.info("Edita la categoría directamente en la tabla. Los cambios de cada página se guardan juntos.")
+
+        valid_categories = get_categories()
+
+        col_sort, col_size, col_page = st.columns([2, 1, 1])
+        sort_label = col_sort.selectbox("Ordenar por", list(SORT_OPTIONS))
+        page_size = col_size.selectbox("Filas por página", TABLE_PAGE_SIZES, index=TABLE_PAGE_SIZES.index(TABLE_PAGE_SIZE) if TABLE_PAGE_SIZE in TABLE_PAGE_SIZES else 1)
+        n_pages = max(1, -(-len(df_filtered) // page_size))
+        page = col_page.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, value=1, step=1, key=f"table_page_{selected_year}_{selected_month}_{page_size}")
+
+        with span("transform"):
+            filter_key = (selected_year, tuple(selected_month))
+            order = table_order(df_filtered, filter_key, sort_label)
+            page_df = df_filtered.iloc[order[(page - 1) * page_size:page * page_size]].copy()
+            # Show the unsaved edits made earlier on this page
+            edits = st.session_state.setdefault("table_edits", {})
+            original = page_df["category"].copy()
+            page_df["category"] = [edits.get(str(i), c) for i, c in zip(page_df["id"], page_df["category"])]
+
+        # One editor state per window, so edits don't leak between pages
+        version = st.session_state.get("ledger", (None,))[0]
+        edited_df = st.data_editor(
+            page_df,
+            column_config={
+                "category": st.column_config.SelectboxColumn(
+                    "Categoría",
+                    help="Clasifícalo",
+                    width="medium",
+                    options=valid_categories,
+                    required=True,
+                ),
+                "amount": st.column_config.NumberColumn(
+                    "Monto",
+                    format="S/ %.2f"
+                ),
+                "status": st.column_config.SelectboxColumn(
+                    "Estado",
+                    options=["verified", "pending_classification"],
+                    disabled=True 
+                )
+            },
+            disabled=["id", "date", "amount", "description", "source", "month", "year"], # Only the category is saved
+            hide_index=True,
+            use_container_width=True,
+            key=f"editor_{version}_{filter_key}_{sort_label}_{page_size}_{page}"
+        )
+
+        # Track edits by transaction id (reverting a cell to its saved value drops the edit)
+        for txn_id, old, new in zip(page_df["id"].astype(str), original, edited_df["category"]):
+            if new == old:
+                edits.pop(txn_id, None)
+            else:
+                edits[txn_id] = new
+
+        st.caption(f"{len(df_filtered)} movimientos · página {page} de {n_pages} · {len(edits)} cambio(s) sin guardar")
+
+        if st.button("💾 Guardar Cambios en Tabla", disabled=not edits):
+            # One Sheets write per target category, only for the rows that changed
+            by_category = {}
+            for txn_id, category in edits.items():
+                by_category.setdefault(category, []).append(txn_id)
+
+            progress_text = "Actualizando base de datos..."
+            my_bar = st.progress(0, text=progress_text)
+            failed = []
+            for done, (category, txn_ids) in enumerate(by_category.items(), start=1):
+                if not update_transactions_category(txn_ids, category):
+                    failed.extend(txn_ids)
+                my_bar.progress(done / len(by_category), text=progress_text)
+
+            st.session_state["table_edits"] = {t: edits[t] for t in failed}
+            if failed:
+                st.error(f"No se pudieron guardar {len(failed)} cambio(s). Inténtalo de nuevo.")
+            else:
+                my_bar.progress(1.0, text="Actualizado completo!")
+                st.success("Datos sincronizados.")
+                st.rerun()
+
+        # Export of the selected year/months, streamed from Sheets in chunks (see export.py)
+        with st.expander("⬇️ Exportar"):
+            col_fmt, col_cat = st.columns(2)
+            export_format = col_fmt.selectbox("Formato", list(export.FORMATS), key="export_format")
+            export_category = col_cat.selectbox("Categoría", ["Todas"] + valid_categories, key="export_category")
+            if st.button("Preparar archivo"):
+                try:
+                    result = export.stream(export_format, year=selected_year, months=selected_month,
+                                           category=None if export_category == "Todas" else export_category)
+                except ValueError as e:
+                    result = None
+                    st.error(str(e))
+                else:
+                    if result is None:
+                        st.warning("Hay otra exportación en curso, inténtalo en unos segundos.")
+                if result is not None:
+                    # Written to disk chunk by chunk; the previous file is replaced
+                    previous = st.session_state.pop("export_file", None)
+                    if previous and os.path.exists(previous["path"]):
+                        os.remove(previous["path"])
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{result.fmt}") as f:
+                        for block in result:
+                            f.write(block)
+                    st.session_state["export_file"] = {
+                        "path": f.name, "filename": result.filename, "mime": result.content_type,
+                        "summary": result.summary.to_dict(),
+                    }
+
+            prepared = st.session_state.get("export_file")
+            if prepared and os.path.exists(prepared["path"]):
+                with open(prepared["path"], "rb") as f:
+                    st.download_button(f"Descargar {prepared['filename']}", f, file_name=prepared["filename"], mime=prepared["mime"])
+                # Monthly summary computed in the same pass as the file
+                summary_rows = [
+                    {"Mes": month, "Categoría": cat, "Total": total}
+                    for month, m in prepared["summary"]["months"].items()
+                    for cat, total in m["by_category"].items()
+                ]
+                st.caption(f"{prepared['summary']['rows']} movimientos exportados.")
+                if summary_rows:
+                    st.dataframe(
+                        pd.DataFrame(summary_rows),
+                        column_config={"Total": st.column_config.NumberColumn("Total", format="S/ %.2f")},
+                        hide_index=True,
+                        use_container_width=True,
+                    )
+
+        st.divider()
+
+        # 3. Analytics
+        st.subheader("📊 Análisis de Gastos")
+        
+        with span("render"):
+            col_chart1, col_chart2 = st.columns(2)
+            
+            with col_chart1:
+                st.markdown("**Por Categoría**")
+                cat_sum = df_filtered.groupby("category")["amount"].sum().reset_index()
+                fig_pie = px.pie(cat_sum, values='amount', names='category', hole=0.4, color_discrete_sequence=px.colors.qualitative.Pastel)
+                st.plotly_chart(fig_pie, use_container_width=True)
+
+            with col_chart2:
+                st.markdown("**Evolución Diaria (Mes Actual)**")
+                # Ensure correct type
+                # In V2, we might want to just show the days of the selected filtered view
+                try:
+                     df_filtered['date_dt'] = pd.to_datetime(df_filtered['date'])
+                     daily_sum = df_filtered.groupby(df_filtered['date_dt'].dt.date)["amount"].sum().reset_index()
+                     fig_bar = px.bar(daily_sum, x='date_dt', y='amount', title="Gastos por Día", color_discrete_sequence=['#4B4EFC'])
+                     st.plotly_chart(fig_bar, use_container_width=True)
+                except Exception as e:
+                    st.error(f"Error parseando fechas: {e}")
+
+        st.divider()
+
+        # 4. Recurring charges (whole ledger, not just the filtered months)
+        st.subheader("🔁 Suscripciones y Gastos Recurrentes")
+        with span("transform"):
+            subs = recurring(df, data_version=(st.session_state.get("ledger", (None,))[0], st.session_state.get("ledger_loads")))
+        if subs.empty:
+            st.caption("No se detectaron cargos recurrentes todavía.")
+        else:
+            st.metric("Costo mensual estimado", f"S/ {subs['monthly_cost'].sum():,.2f}")
+            st.dataframe(
+                subs.drop(columns=["key"]),
+                column_config={
+                    "description": "Descripción",
+                    "source": "Fuente",
+                    "amount": st.column_config.NumberColumn("Monto", format="S/ %.2f"),
+                    "period": "Periodo",
+                    "occurrences": "Veces",
+                    "last_date": st.column_config.DateColumn("Último"),
+                    "next_date": st.column_config.DateColumn("Próximo"),
+                    "monthly_cost": st.column_config.NumberColumn("Costo mensual", format="S/ %.2f"),
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
+
+    else:
+        st.warning("No hay datos aún. Usa el formulario de la izquierda o espera a que lleguen correos.")
+
+# Latency histograms of previous runs (PROFILING=1)
+if PROFILING_ENABLED:
+    with st.sidebar.expander("⏱️ Perfil"):
+        st.code(report())
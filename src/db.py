@@ -1,27 +1,143 @@
-import gsheets
 from datetime import datetime
+import budgets
+import ledger_cache
+import search
+
+# The Sheets backend pulls in gspread, oauth2client and pandas. It is imported on
+# first use so processes like the bot can open their health port before paying for it.
+_gsheets = None
+
+def _backend():
+    global _gsheets
+    if _gsheets is None:
+        import gsheets
+        _gsheets = gsheets
+    return _gsheets
+
+def warm_up(spreadsheet_id=None):
+    """Import the backend and open the worksheet ahead of the first request."""
+    return _backend().warm_up(spreadsheet_id=spreadsheet_id)
+
+def default_spreadsheet_id():
+    """Id of the default (owner's) ledger."""
+    return _backend().SPREADSHEET_ID
 
 def init_db():
     """Checks and creates headers in the Google Sheet."""
-    gsheets.ensure_headers()
+    _backend().ensure_headers()
     print("Google Sheets initialized with headers.")
 
-def add_transaction(date, amount, description, source, category='Otros', status='pending_classification'):
+def add_transaction(date, amount, description, source, category='Otros', status='pending_classification', spreadsheet_id=None):
     """Add a new transaction via Google Sheets."""
     print(f"Adding transaction: {description}, {amount}")
-    return gsheets.add_transaction(date, amount, description, source, category, status)
+    row = new_transaction_row(date, amount, description, source, category, status)
+    return append_transactions([row], spreadsheet_id=spreadsheet_id)
+
+def new_transaction_row(date, amount, description, source, category='Otros', status='pending_classification'):
+    """Build a V2 row (with a fresh id) without touching Sheets."""
+    import time
+    txn_id = f"txn_{int(time.time()*1000)}"
+    # Input date format expected: YYYY-MM-DD HH:MM:SS
+    try:
+        dt_obj = datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+        month_str = dt_obj.strftime("%m")
+        year_str = dt_obj.strftime("%Y")
+    except:
+        month_str = "Unknown"
+        year_str = "Unknown"
+    # ["id", "date", "month", "year", "amount", "description", "category", "source", "status"]
+    return [txn_id, date, month_str, year_str, amount, description, category, source, status]
+
+def append_transactions(rows, spreadsheet_id=None):
+    """Append several pre-built V2 rows in one Sheets call."""
+    ok = _backend().append_transactions(rows, spreadsheet_id=spreadsheet_id)
+    if ok:
+        ledger_cache.record_append(spreadsheet_id, rows, _backend().last_written_version(spreadsheet_id=spreadsheet_id))
+        for row in rows:
+            budgets.record_insert(spreadsheet_id, row)
+            search.index_row(spreadsheet_id, row)
+    return ok
+
+def get_transaction_ids(spreadsheet_id=None):
+    """Return the set of transaction ids currently stored in Sheets."""
+    return _backend().get_transaction_ids(spreadsheet_id=spreadsheet_id)
+
+def get_data_version(spreadsheet_id=None):
+    """Cheap change stamp: bumped by every write, compare it before reloading."""
+    return _backend().get_data_version(spreadsheet_id=spreadsheet_id)
 
-def get_transactions_df():
+def last_written_version(spreadsheet_id=None):
+    """Version stamped by this process's latest write (no API call)."""
+    return _backend().last_written_version(spreadsheet_id=spreadsheet_id)
+
+def get_transactions_df(spreadsheet_id=None):
     """Return all transactions from Google Sheets as DataFrame."""
-    return gsheets.get_transactions_df()
+    return _backend().get_transactions_df(spreadsheet_id=spreadsheet_id)
+
+def iter_transactions(chunk_rows=None, spreadsheet_id=None):
+    """Yield all V2 rows in bounded chunks (lists of rows), for streaming exports."""
+    return _backend().iter_rows(chunk_rows, spreadsheet_id=spreadsheet_id)
+
+def get_pending_ids(spreadsheet_id=None):
+    """Return {txn_id: row_number} for pending transactions (narrow read)."""
+    return _backend().get_pending_ids(spreadsheet_id=spreadsheet_id)
+
+def get_pending_transactions(row_numbers, spreadsheet_id=None):
+    """Return the full rows for the given pending row numbers."""
+    return _backend().get_rows(row_numbers, spreadsheet_id=spreadsheet_id)
 
-def update_transaction_category(tx_id, new_category):
+def get_pending_snapshot(limit, spreadsheet_id=None):
+    """
+    (pending ids in sheet order, the first `limit` pending rows). Served from the
+    read-your-writes cache (ledger_cache.py) while it is fresh, otherwise reconciled
+    with Sheets. Returns None if Sheets could not be read.
+    """
+    cached = ledger_cache.pending(spreadsheet_id, limit)
+    if cached is not None:
+        return cached
+    return refresh_pending(limit, spreadsheet_id=spreadsheet_id)
+
+def refresh_pending(limit, spreadsheet_id=None):
+    """
+    Reconcile the cached pending set with Sheets: a single-cell version read when
+    nothing changed, the narrow id/status read plus the first `limit` rows otherwise.
+    """
+    data_version = get_data_version(spreadsheet_id=spreadsheet_id)
+    if ledger_cache.renew(spreadsheet_id, data_version):
+        cached = ledger_cache.pending(spreadsheet_id, limit)
+        if cached is not None:
+            return cached
+
+    pending_ids = get_pending_ids(spreadsheet_id=spreadsheet_id)
+    if pending_ids is None:
+        return None
+    ordered = sorted(pending_ids, key=pending_ids.get)
+    rows = get_pending_transactions([pending_ids[i] for i in ordered[:limit]], spreadsheet_id=spreadsheet_id)
+    ledger_cache.load(spreadsheet_id, data_version, ordered, rows)
+    # Read back through the cache so local writes made meanwhile are included
+    return ledger_cache.pending(spreadsheet_id, limit) or (ordered, rows)
+
+def update_transaction_category(tx_id, new_category, spreadsheet_id=None):
     """Update the category of a specific transaction in Sheets."""
-    return gsheets.update_category(tx_id, new_category)
+    ok = _backend().update_category(tx_id, new_category, spreadsheet_id=spreadsheet_id)
+    if ok:
+        ledger_cache.record_classification(spreadsheet_id, [tx_id], _backend().last_written_version(spreadsheet_id=spreadsheet_id))
+        budgets.record_category_change(spreadsheet_id, [tx_id], new_category)
+        search.set_category(spreadsheet_id, [tx_id], new_category)
+    return ok
+
+def update_transactions_category(tx_ids, new_category, spreadsheet_id=None):
+    """Update the category of several transactions in one Sheets write."""
+    ok = _backend().update_categories(tx_ids, new_category, spreadsheet_id=spreadsheet_id)
+    if ok:
+        ledger_cache.record_classification(spreadsheet_id, tx_ids, _backend().last_written_version(spreadsheet_id=spreadsheet_id))
+        budgets.record_category_change(spreadsheet_id, tx_ids, new_category)
+        search.set_category(spreadsheet_id, tx_ids, new_category)
+    return ok
 
 def get_categories():
     """Get list of categories."""
-    return gsheets.get_categories()
+    return _backend().get_categories()
 
 if __name__ == "__main__":
     init_db()
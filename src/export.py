@@ -0,0 +1,260 @@
+import csv
+import io
+import os
+import tempfile
+import threading
+
+import db
+import search
+
+# Streaming exports of a ledger slice (year / months / category) as CSV, Parquet or XLSX.
+#
+# Rows are read from Sheets in bounded chunks (db.iter_transactions) and written out
+# chunk by chunk, so memory stays at one chunk whatever the ledger size:
+#   - CSV is streamed straight to the client.
+#   - Parquet (one row group per chunk) and XLSX (openpyxl write-only mode) need their
+#     footer / zip directory at the end, so they are built in a spooled temp file
+#     (in memory up to SPOOL_BYTES, then on disk) and streamed from there.
+#
+# The same pass accumulates monthly summaries (totals by category and daily series,
+# in integer cents like budgets.py). They are cached per ledger, data version and
+# slice, so summary() right after an export costs no extra read.
+#
+# pyarrow (Parquet) and openpyxl (XLSX) are optional and imported on first use.
+
+COLUMNS = ["id", "date", "month", "year", "amount", "description", "category", "source", "status"]
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", 1000))
+SPOOL_BYTES = int(os.environ.get("EXPORT_SPOOL_BYTES", 8 * 1024 * 1024))
+READ_BLOCK_BYTES = 64 * 1024
+# Optional writer dependencies, checked before any byte is sent
+REQUIRES = {"parquet": "pyarrow", "xlsx": "openpyxl"}
+# Exports running at the same time (each holds a Sheets reader and a spool file)
+MAX_CONCURRENT = int(os.environ.get("EXPORT_MAX_CONCURRENT", 2))
+
+_slots = threading.BoundedSemaphore(MAX_CONCURRENT)
+_lock = threading.Lock()
+_summaries = {}  # (ledger, data_version, year, months, category) -> summary dict
+
+def _text(value):
+    """Cell value as text; whole numbers lose the '.0' Sheets gives them."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def _cents(amount):
+    try:
+        return int(round(float(amount) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+def _slice_key(spreadsheet_id, data_version, year, months, category):
+    return (spreadsheet_id, data_version, year, tuple(sorted(months or ())), category)
+
+def _remember(key, result):
+    """Cache a summary; older data versions of the same ledger are dropped."""
+    with _lock:
+        for stale in [k for k in _summaries if k[0] == key[0] and k[1] != key[1]]:
+            del _summaries[stale]
+        _summaries[key] = result
+
+def _normalize(year, months, category):
+    year = str(year) if year else None
+    months = {str(m).zfill(2) for m in months} if months else None
+    if months and not all(m.isdigit() and 1 <= int(m) <= 12 for m in months):
+        raise ValueError(f"Invalid month in {sorted(months)}")
+    return year, months, category or None
+
+class Summary:
+    """Monthly totals by category and daily series, filled while rows stream past."""
+
+    def __init__(self):
+        self.rows = 0
+        self.months = {}  # 'YYYY-MM' -> {"total": cents, "by_category": {cat: cents}, "daily": {'YYYY-MM-DD': cents}}
+
+    def add(self, row):
+        cents = _cents(row[4])
+        month = self.months.setdefault(f"{row[3]}-{row[2]}", {"total": 0, "by_category": {}, "daily": {}})
+        month["total"] += cents
+        month["by_category"][row[6]] = month["by_category"].get(row[6], 0) + cents
+        day = row[1][:10]
+        month["daily"][day] = month["daily"].get(day, 0) + cents
+        self.rows += 1
+
+    def to_dict(self):
+        """Amounts in soles, months and days in order."""
+        return {
+            "rows": self.rows,
+            "months": {
+                key: {
+                    "total": m["total"] / 100,
+                    "by_category": {c: v / 100 for c, v in sorted(m["by_category"].items(), key=lambda kv: -kv[1])},
+                    "daily": {d: v / 100 for d, v in sorted(m["daily"].items())},
+                }
+                for key, m in sorted(self.months.items())
+            },
+        }
+
+def _iter_slice(spreadsheet_id, year, months, category, summary):
+    """Yield the matching rows chunk by chunk, feeding the summary on the way."""
+    for chunk in db.iter_transactions(CHUNK_ROWS, spreadsheet_id=spreadsheet_id):
+        rows = []
+        for raw in chunk:
+            row = [_text(v) for v in raw]
+            row[2] = row[2].zfill(2)
+            if year and row[3] != year:
+                continue
+            if months and row[2] not in months:
+                continue
+            if category and row[6] != category:
+                continue
+            row[4] = _cents(raw[4]) / 100
+            summary.add(row)
+            rows.append(row)
+        if rows:
+            yield rows
+
+def _write_csv(chunks):
+    # BOM so Excel opens the accents correctly
+    yield "\ufeff".encode("utf-8")
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield out.getvalue().encode("utf-8")
+        out.seek(0)
+        out.truncate()
+    if out.getvalue():
+        yield out.getvalue().encode("utf-8")
+
+def _stream_spool(spool):
+    spool.seek(0)
+    while True:
+        block = spool.read(READ_BLOCK_BYTES)
+        if not block:
+            break
+        yield block
+
+def _write_parquet(chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.float64() if c == "amount" else pa.string()) for c in COLUMNS])
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        with pq.ParquetWriter(spool, schema) as writer:
+            for rows in chunks:
+                columns = list(zip(*rows))
+                writer.write_table(pa.Table.from_arrays([pa.array(col, type=f.type) for col, f in zip(columns, schema)], schema=schema))
+        yield from _stream_spool(spool)
+
+def _write_xlsx(chunks, summary):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Movimientos")
+    ws.append(COLUMNS)
+    for rows in chunks:
+        for row in rows:
+            ws.append(row)
+
+    # Summaries from the same pass, one sheet each
+    data = summary.to_dict()["months"]
+    by_category = wb.create_sheet("Resumen")
+    by_category.append(["month", "category", "total"])
+    daily = wb.create_sheet("Diario")
+    daily.append(["date", "total"])
+    for month, m in data.items():
+        for cat, total in m["by_category"].items():
+            by_category.append([month, cat, total])
+        for day, total in m["daily"].items():
+            daily.append([day, total])
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        wb.save(spool)
+        yield from _stream_spool(spool)
+
+class Export:
+    """
+    An export in progress. Iterate it for the file bytes (e.g. as a Flask response
+    body); close() frees the export slot and is safe to call more than once.
+    """
+
+    def __init__(self, fmt, spreadsheet_id, year, months, category, data_version):
+        self.fmt = fmt
+        self.content_type = FORMATS[fmt]
+        self.summary = Summary()
+        self._args = (spreadsheet_id, year, months, category)
+        self._key = _slice_key(spreadsheet_id, data_version, year, months, category)
+        self._released = False
+
+    @property
+    def filename(self):
+        _, year, months, category = self._args
+        parts = ["gastos", year or "todo"] + sorted(months or []) + ([search.fold(category)] if category else [])
+        # ASCII only: it goes into a Content-Disposition header
+        return "_".join(parts).encode("ascii", "ignore").decode() + f".{self.fmt}"
+
+    def __iter__(self):
+        try:
+            chunks = _iter_slice(*self._args, self.summary)
+            if self.fmt == "csv":
+                yield from _write_csv(chunks)
+            elif self.fmt == "parquet":
+                yield from _write_parquet(chunks)
+            else:
+                yield from _write_xlsx(chunks, self.summary)
+            # Complete pass: keep its summary for this data version
+            _remember(self._key, self.summary.to_dict())
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            _slots.release()
+
+def stream(fmt, spreadsheet_id=None, year=None, months=None, category=None):
+    """
+    Start an export of the slice. Returns an Export to iterate, or None when
+    MAX_CONCURRENT exports are already running. Raises ValueError on bad arguments.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}' (use {', '.join(FORMATS)})")
+    if fmt in REQUIRES:
+        import importlib.util
+        if importlib.util.find_spec(REQUIRES[fmt]) is None:
+            raise ValueError(f"{fmt} export needs the '{REQUIRES[fmt]}' package installed")
+    year, months, category = _normalize(year, months, category)
+    if not _slots.acquire(blocking=False):
+        return None
+    try:
+        data_version = db.get_data_version(spreadsheet_id=spreadsheet_id)
+    except Exception:
+        _slots.release()
+        raise
+    return Export(fmt, spreadsheet_id, year, months, category, data_version)
+
+def summary(spreadsheet_id=None, year=None, months=None, category=None):
+    """
+    Monthly summary of the slice: the one computed by the last export at the current
+    data version if there is one, otherwise a streaming pass without writing a file.
+    """
+    year, months, category = _normalize(year, months, category)
+    data_version = db.get_data_version(spreadsheet_id=spreadsheet_id)
+    key = _slice_key(spreadsheet_id, data_version, year, months, category)
+    with _lock:
+        cached = _summaries.get(key)
+    if cached is not None and data_version:
+        return cached
+
+    result = Summary()
+    for _ in _iter_slice(spreadsheet_id, year, months, category, result):
+        pass
+    result = result.to_dict()
+    _remember(key, result)
+    return result
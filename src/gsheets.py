@@ -1,8 +1,10 @@
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import os
-import pandas as pd
 import json
+import threading
+from collections import OrderedDict
+import hashlib
 from datetime import datetime
 import traceback
 
@@ -13,8 +15,9 @@ SCOPE = [
 ]
 
 CREDENTIALS_FILE = "credentials.json"
-# Updated to the specific ID provided by the user
-SPREADSHEET_ID = "11LEjhe_ctFTNs5BuWAVecVpzbCAndxoTOBYNMgMXhkA"
+# Updated to the specific ID provided by the user.
+# Default ledger; chats can be routed to their own spreadsheet (see tenants.py).
+SPREADSHEET_ID = os.environ.get("SPREADSHEET_ID", "11LEjhe_ctFTNs5BuWAVecVpzbCAndxoTOBYNMgMXhkA")
 
 # Standard columns
 COLUMNS = ["id", "date", "amount", "description", "category", "source", "status"]
@@ -23,6 +26,21 @@ COLUMNS_V2 = ["id", "date", "month", "year", "amount", "description", "category"
 
 WORKSHEET_NAME = "Gastos_V2_Data"
 
+# Rows per get_values call when streaming the whole ledger (exports)
+READ_CHUNK_ROWS = int(os.environ.get("READ_CHUNK_ROWS", 1000))
+
+# One authorized client per process, shared by every tenant (same service account)
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    """Return the cached authorized client, connecting on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = get_db_connection()
+        return _client
+
 def get_db_connection():
     """
     Connects to Google Sheets using:
@@ -81,14 +99,26 @@ def get_db_connection():
         print(f"❌ Error connecting to Google Sheets: {e}")
         return None
 
-def _get_sheet(force_v2=True):
-    """Helper to get the main worksheet."""
-    client = get_db_connection()
+# Authorized worksheet handles keyed by (spreadsheet_id, force_v2), reused across
+# calls instead of re-opening each time. LRU so hundreds of tenants stay bounded.
+SHEET_CACHE_SIZE = int(os.environ.get("SHEET_CACHE_SIZE", 256))
+_sheet_cache = OrderedDict()
+_sheet_cache_lock = threading.Lock()
+
+def _get_sheet(force_v2=True, spreadsheet_id=None):
+    """Helper to get the main worksheet of a spreadsheet (default: SPREADSHEET_ID)."""
+    key = (spreadsheet_id or SPREADSHEET_ID, force_v2)
+    with _sheet_cache_lock:
+        if key in _sheet_cache:
+            _sheet_cache.move_to_end(key)
+            return _sheet_cache[key]
+
+    client = _get_client()
     if not client:
         return None
     try:
         # Open by Key (ID) is more robust than name
-        sh = client.open_by_key(SPREADSHEET_ID)
+        sh = client.open_by_key(key[0])
         
         target_name = WORKSHEET_NAME if force_v2 else "Hoja 1"
         try:
@@ -100,15 +130,98 @@ def _get_sheet(force_v2=True):
             else:
                 # Fallback to sheet1 if looking for legacy and specific name fails
                 sheet = sh.sheet1
-                
+
+        if force_v2:
+            _ensure_v2_headers(sheet)
+
+        with _sheet_cache_lock:
+            _sheet_cache[key] = sheet
+            while len(_sheet_cache) > SHEET_CACHE_SIZE:
+                _sheet_cache.popitem(last=False)
         return sheet
     except Exception as e:
         print(f"Error opening sheet: {e}")
         return None
 
-def ensure_headers_v2():
+def _ensure_v2_headers(sheet):
+    """
+    Write the header row into an empty V2 tab (e.g. one just created for a new
+    tenant): data is read from row 2 and get_all_records keys rows by row 1.
+    """
+    if not sheet.row_values(1):
+        print(f"{WORKSHEET_NAME} is empty. Adding headers...")
+        sheet.append_row(COLUMNS_V2)
+
+def warm_up(spreadsheet_id=None):
+    """Connect and cache the V2 worksheet. Returns True if it is reachable."""
+    return _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id) is not None
+
+# Data version stamp: a tiny '_meta' tab whose B1 cell is bumped by every write path.
+# Readers compare it (one single-cell read) to skip reloading unchanged data.
+META_WORKSHEET = "_meta"
+META_VERSION_RANGE = f"'{META_WORKSHEET}'!B1"
+_last_version = {}   # spreadsheet_id -> last version this process wrote/saw
+_last_written = {}   # spreadsheet_id -> last version this process wrote
+_meta_ready = set()  # spreadsheets where the _meta tab is known to exist
+
+def _ensure_meta(ss):
+    if ss.id in _meta_ready:
+        return
+    try:
+        ss.worksheet(META_WORKSHEET)
+    except gspread.WorksheetNotFound:
+        meta = ss.add_worksheet(title=META_WORKSHEET, rows=2, cols=2)
+        meta.update_acell('A1', "data_version")
+    _meta_ready.add(ss.id)
+
+def _next_version(ss):
+    """Millisecond timestamp, strictly above anything this process has seen."""
+    import time
+    version = max(int(time.time() * 1000), _last_version.get(ss.id, 0) + 1)
+    _last_version[ss.id] = version
+    _last_written[ss.id] = version
+    return version
+
+def _version_update(ss):
+    """ValueRange that bumps the version, to include in a values_batch_update."""
+    _ensure_meta(ss)
+    return {"range": META_VERSION_RANGE, "values": [[_next_version(ss)]]}
+
+def _bump_version(ss):
+    """Bump the version on its own (after writes that can't carry it, like append)."""
+    try:
+        ss.values_batch_update(body={"valueInputOption": "RAW", "data": [_version_update(ss)]})
+    except Exception as e:
+        # Readers fall back to a reload when the stamp is missing, so this is not fatal
+        print(f"Error bumping data version: {e}")
+
+def bump_version(spreadsheet_id=None):
+    """Bump the data version after writing rows outside this module (e.g. migrate.py)."""
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
+    if sheet:
+        _bump_version(sheet.spreadsheet)
+
+def last_written_version(spreadsheet_id=None):
+    """Version stamped by this process's latest write to the spreadsheet (no API call)."""
+    return _last_written.get(spreadsheet_id or SPREADSHEET_ID, 0)
+
+def get_data_version(spreadsheet_id=None):
+    """Current data version (one single-cell read). 0 if unknown / never written."""
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
+    if not sheet:
+        return 0
+    try:
+        values = sheet.spreadsheet.values_get(META_VERSION_RANGE).get("values", [])
+        version = int(values[0][0]) if values and values[0] else 0
+        _last_version[sheet.spreadsheet.id] = max(version, _last_version.get(sheet.spreadsheet.id, 0))
+        return version
+    except Exception as e:
+        print(f"Error reading data version: {e}")
+        return 0
+
+def ensure_headers_v2(spreadsheet_id=None):
     """Checks if headers exist in V2 sheet, adds them if not."""
-    sheet = _get_sheet(force_v2=True)
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
     if not sheet:
         return
 
@@ -116,8 +229,7 @@ def ensure_headers_v2():
         # Get first row
         headers = sheet.row_values(1)
         if not headers:
-            print("V2 Sheet is empty. Adding headers...")
-            sheet.append_row(COLUMNS_V2)
+            _ensure_v2_headers(sheet)
         else:
              # Check if headers match V2
             if headers != COLUMNS_V2:
@@ -125,7 +237,7 @@ def ensure_headers_v2():
                 # Ideally we might migrate or warn, for now just print
     except Exception as e:
         print(f"Error checking headers: {e}")
-    sheet = _get_sheet()
+    sheet = _get_sheet(force_v2=False, spreadsheet_id=spreadsheet_id)
     if not sheet: 
         return
     
@@ -134,9 +246,11 @@ def ensure_headers_v2():
         print("Initializing headers...")
         sheet.insert_row(COLUMNS, 1)
 
-def get_transactions_df():
+def get_transactions_df(spreadsheet_id=None):
     """Fetch all transactions as a Pandas DataFrame."""
-    sheet = _get_sheet(force_v2=True)
+    import pandas as pd
+
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
     if not sheet:
         return pd.DataFrame(columns=COLUMNS_V2)
 
@@ -153,9 +267,73 @@ def get_transactions_df():
         print(f"Error fetching transactions: {e}")
         return pd.DataFrame(columns=COLUMNS_V2)
 
-def add_transaction(date, amount, description, source, category='Otros', status='pending_classification'):
+def get_pending_ids(spreadsheet_id=None):
+    """
+    Cheap pending check: reads only the id (A) and status (I) columns in a single
+    batch_get and returns {txn_id: row_number} for rows still pending classification.
+    Returns None if the sheet could not be read.
+    """
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
+    if not sheet:
+        return None
+
+    try:
+        ids_col, status_col = sheet.batch_get(['A2:A', 'I2:I'])
+        pending = {}
+        for offset, id_cell in enumerate(ids_col):
+            status_cell = status_col[offset] if offset < len(status_col) else []
+            if id_cell and status_cell and status_cell[0] == 'pending_classification':
+                # Data starts at row 2 (row 1 holds the headers)
+                pending[str(id_cell[0])] = offset + 2
+        return pending
+    except Exception as e:
+        print(f"Error fetching pending ids: {e}")
+        return None
+
+def get_rows(row_numbers, spreadsheet_id=None):
+    """Fetch full V2 rows by sheet row number in one batch_get, as a list of dicts."""
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
+    if not sheet or not row_numbers:
+        return []
+
+    try:
+        ranges = [f"A{n}:I{n}" for n in row_numbers]
+        rows = []
+        for value_range in sheet.batch_get(ranges):
+            if not value_range:
+                continue
+            values = list(value_range[0]) + [""] * (len(COLUMNS_V2) - len(value_range[0]))
+            rows.append(dict(zip(COLUMNS_V2, values)))
+        return rows
+    except Exception as e:
+        print(f"Error fetching rows: {e}")
+        return []
+
+def iter_rows(chunk_rows=None, spreadsheet_id=None):
+    """
+    Yield the V2 data rows in chunks (lists of rows padded to COLUMNS_V2), with one
+    bounded get_values range read per chunk, so only one chunk is in memory at a time.
+    """
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
+    if not sheet:
+        return
+
+    chunk_rows = chunk_rows or READ_CHUNK_ROWS
+    start = 2  # row 1 holds the headers
+    while True:
+        end = start + chunk_rows - 1
+        chunk = sheet.get_values(f"A{start}:I{end}", value_render_option='UNFORMATTED_VALUE')
+        if not chunk:
+            break
+        yield [list(r) + [""] * (len(COLUMNS_V2) - len(r)) for r in chunk if any(c != "" for c in r)]
+        if len(chunk) < chunk_rows:
+            # get_values trims trailing empty rows: this was the last chunk
+            break
+        start = end + 1
+
+def add_transaction(date, amount, description, source, category='Otros', status='pending_classification', spreadsheet_id=None):
     """Add a new transaction to the Google Sheet."""
-    sheet = _get_sheet(force_v2=True)
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
     if not sheet:
         return False
 
@@ -180,6 +358,7 @@ def add_transaction(date, amount, description, source, category='Otros', status=
         row = [txn_id, date, month_str, year_str, amount, description, category, source, status]
         
         sheet.append_row(row)
+        _bump_version(sheet.spreadsheet)
         print("Transaction added successfully.")
         return True
     except Exception as e:
@@ -187,9 +366,38 @@ def add_transaction(date, amount, description, source, category='Otros', status=
         traceback.print_exc()
         return False
 
-def update_category(txn_id, category, status="verified"):
+def append_transactions(rows, spreadsheet_id=None):
+    """Append several V2 rows with a single append_rows call."""
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
+    if not sheet:
+        return False
+
+    try:
+        sheet.append_rows(rows)
+        _bump_version(sheet.spreadsheet)
+        print(f"{len(rows)} transactions added successfully.")
+        return True
+    except Exception as e:
+        print(f"Error adding transactions: {e}")
+        traceback.print_exc()
+        return False
+
+def get_transaction_ids(spreadsheet_id=None):
+    """Return the set of ids in column A (one narrow read)."""
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
+    if not sheet:
+        raise RuntimeError("Google Sheets not available")
+    return set(sheet.col_values(1)[1:])
+
+def _write_cells(sheet, updates):
+    """Write A1 ranges of the data sheet and bump the data version in one request."""
+    data = [{"range": f"'{sheet.title}'!{u['range']}", "values": u["values"]} for u in updates]
+    data.append(_version_update(sheet.spreadsheet))
+    sheet.spreadsheet.values_batch_update(body={"valueInputOption": "RAW", "data": data})
+
+def update_category(txn_id, category, status="verified", spreadsheet_id=None):
     """Update category and status for a transaction."""
-    sheet = _get_sheet(force_v2=True)
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
     if not sheet:
         return False
         
@@ -202,11 +410,13 @@ def update_category(txn_id, category, status="verified"):
             print(f"Transaction {txn_id} not found.")
             return False
             
-        # Update Category (Column G -> 7 in V2)
+        # Update Category (Column G -> 7 in V2) and Status (Column I -> 9), plus the
+        # data version, in a single write
         # COLUMNS_V2 = ["id", "date", "month", "year", "amount", "description", "category", "source", "status"]
-        
-        sheet.update_cell(cell.row, 7, category)
-        sheet.update_cell(cell.row, 9, status)
+        _write_cells(sheet, [
+            {"range": f"G{cell.row}", "values": [[category]]},
+            {"range": f"I{cell.row}", "values": [[status]]},
+        ])
         
         print(f"Updated {txn_id}: {category} ({status})")
         return True
@@ -214,57 +424,202 @@ def update_category(txn_id, category, status="verified"):
         print(f"Error updating category: {e}")
         return False
 
+def update_categories(txn_ids, category, status="verified", spreadsheet_id=None):
+    """Update category and status for several transactions with one read and one write."""
+    sheet = _get_sheet(force_v2=True, spreadsheet_id=spreadsheet_id)
+    if not sheet:
+        return False
+
+    try:
+        wanted = {str(t) for t in txn_ids}
+        ids = sheet.col_values(1)
+        rows = [i + 1 for i, val in enumerate(ids) if val in wanted]
+        if len(rows) != len(wanted):
+            print(f"Some transactions were not found: {len(wanted) - len(rows)} missing.")
+        if not rows:
+            return False
+
+        # Category is column G (7), status is column I (9) in V2
+        updates = []
+        for r in rows:
+            updates.append({"range": f"G{r}", "values": [[category]]})
+            updates.append({"range": f"I{r}", "values": [[status]]})
+        _write_cells(sheet, updates)
+
+        print(f"Updated {len(rows)} transactions: {category} ({status})")
+        return True
+    except Exception as e:
+        print(f"Error updating categories: {e}")
+        return False
+
 def get_categories():
     """Returns a list of valid categories."""
     return ['Comida', 'Transporte', 'Servicios', 'Ocio', 'Salud', 'Educación', 'Ropa', 'Ahorro', 'Otros']
 
-def create_summary_chart():
-    """Creates a visually appealing summary in 'Dashboard_Gastos_v2' linked to 'Gastos_V2_Data'."""
-    client = get_db_connection()
+DASHBOARD_NAME = "Dashboard_Gastos_v2"
+# Bump when the dashboard layout below changes so existing tabs get rebuilt
+DASHBOARD_LAYOUT_VERSION = 2
+DASHBOARD_FINGERPRINT_KEY = "dashboard_fingerprint"
+
+def _category_totals(sheet):
+    """Aggregate amount (E) by category (G) from a single narrow batch_get."""
+    amounts, categories = sheet.batch_get(['E2:E', 'G2:G'], value_render_option='UNFORMATTED_VALUE')
+    totals = {}
+    for offset, cat_cell in enumerate(categories):
+        if not cat_cell or cat_cell[0] in ("", None):
+            continue
+        amount_cell = amounts[offset] if offset < len(amounts) else []
+        try:
+            amount = float(amount_cell[0]) if amount_cell else 0.0
+        except (TypeError, ValueError):
+            amount = 0.0
+        totals[str(cat_cell[0])] = totals.get(str(cat_cell[0]), 0.0) + amount
+    return sorted(totals.items())
+
+def _cell(value, bold=False, currency=False, background=None):
+    """Build a CellData dict for updateCells."""
+    if isinstance(value, (int, float)):
+        cell = {"userEnteredValue": {"numberValue": value}}
+    else:
+        cell = {"userEnteredValue": {"stringValue": str(value)}}
+    fmt = {}
+    if bold:
+        fmt["textFormat"] = {"bold": True}
+    if currency:
+        fmt["numberFormat"] = {"type": "CURRENCY", "pattern": "\"S/ \"#,##0.00"}
+    if background:
+        fmt["backgroundColor"] = background
+    if fmt:
+        cell["userEnteredFormat"] = fmt
+    return cell
+
+def create_summary_chart(force=False, spreadsheet_id=None):
+    """
+    Builds 'Dashboard_Gastos_v2' from precomputed category totals of 'Gastos_V2_Data'.
+
+    Reads the data version and the spreadsheet metadata; when the fingerprint (layout
+    version + data version) stored as developer metadata on the dashboard tab is
+    unchanged the rebuild is skipped, unless force=True. Otherwise reads the
+    amount/category columns once and writes values, formatting and a native pie
+    chart in a single batch_update.
+    """
+    client = _get_client()
     if not client: return False
-    
+
     try:
-        ss = client.open_by_key(SPREADSHEET_ID)
-        
-        # 1. Ensure Dashboard tab exists (Visual Only)
-        dash_name = "Dashboard_Gastos_v2"
-        try:
-            dashboard = ss.worksheet(dash_name)
-        except:
-            dashboard = ss.add_worksheet(title=dash_name, rows=100, cols=20)
-            
-        print(f"Update visual dashboard: {dash_name}")
-        
-        # 2. Clear Sheet to reset layout
-        dashboard.clear()
+        ss = client.open_by_key(spreadsheet_id or SPREADSHEET_ID)
+        data_sheet = ss.worksheet(WORKSHEET_NAME)
 
-        # 3. Add "Scorecards" at the top
-        dashboard.update_acell('C2', "Total Gastado V2")
-        dashboard.update_acell('D2', '=SUM(B6:B)') 
+        data_version = get_data_version(spreadsheet_id)
+        totals = None
+        if not data_version:
+            # No version stamp yet: fingerprint the aggregates themselves
+            totals = _category_totals(data_sheet)
+        fingerprint = hashlib.sha1(
+            json.dumps([DASHBOARD_LAYOUT_VERSION, data_version or totals]).encode("utf-8")
+        ).hexdigest()
 
-        # 4. Add Aggregation Table starting at row 5
-        try:
-             dashboard.batch_clear(['A5:B100'])
-        except:
-             pass
-
-        # Query referencing Gastos_V2_Data
-        # Columns in V2: 
-        # A=id, B=date, C=month, D=year, E=amount, F=description, G=category, H=source, I=status
-        # We want Group By Category (G), Sum Amount (E).
-        # Labels: G 'Categoría', Sum(E) 'Total'
-        query_formula = f'=QUERY(\'{WORKSHEET_NAME}\'!A:I, "SELECT G, SUM(E) WHERE G IS NOT NULL GROUP BY G LABEL G \'Categoría\', SUM(E) \'Total\'", 1)'
-        dashboard.update_acell('A5', query_formula)
-
-        # 5. Chart creation (Simplified, passing for now to avoid complexity, Google Sheets needs strict JSON)
-        # We will just leave the table + scorecards which is safer and "looks good" enough for auto-setup.
-        # User can add fancy charts manually on top of this aggregation.
-        
-        print(f"Dashboard {dash_name} updated.")
+        metadata = ss.fetch_sheet_metadata(params={
+            "fields": "sheets(properties(sheetId,title),charts(chartId),developerMetadata)"
+        })
+        dash_meta = next(
+            (s for s in metadata.get("sheets", []) if s["properties"]["title"] == DASHBOARD_NAME),
+            None
+        )
+
+        requests = []
+        if dash_meta is None:
+            dash_id = max(s["properties"]["sheetId"] for s in metadata["sheets"]) + 1
+            requests.append({"addSheet": {"properties": {
+                "sheetId": dash_id, "title": DASHBOARD_NAME,
+                "gridProperties": {"rowCount": 100, "columnCount": 20}
+            }}})
+            stored = None
+        else:
+            dash_id = dash_meta["properties"]["sheetId"]
+            stored = next(
+                (m for m in dash_meta.get("developerMetadata", []) if m.get("metadataKey") == DASHBOARD_FINGERPRINT_KEY),
+                None
+            )
+            if not force and stored and stored.get("metadataValue") == fingerprint:
+                print(f"Dashboard {DASHBOARD_NAME} is up to date, skipping rebuild.")
+                return True
+            # Drop charts from previous builds, they are recreated below
+            for chart in dash_meta.get("charts", []):
+                requests.append({"deleteEmbeddedObject": {"objectId": chart["chartId"]}})
+
+        print(f"Update visual dashboard: {DASHBOARD_NAME}")
+        if totals is None:
+            totals = _category_totals(data_sheet)
+        grand_total = round(sum(t for _, t in totals), 2)
+
+        header_bg = {"red": 0.29, "green": 0.31, "blue": 0.99}
+        rows = [
+            {"values": []},
+            {"values": [_cell(""), _cell(""), _cell("Total Gastado V2", bold=True), _cell(grand_total, bold=True, currency=True)]},
+            {"values": []},
+            {"values": []},
+            {"values": [_cell("Categoría", bold=True, background=header_bg), _cell("Total", bold=True, background=header_bg)]},
+        ]
+        for category, total in totals:
+            rows.append({"values": [_cell(category), _cell(round(total, 2), currency=True)]})
+
+        # 1. Reset layout, 2. write values + formatting
+        requests.append({"updateCells": {
+            "range": {"sheetId": dash_id},
+            "fields": "userEnteredValue,userEnteredFormat"
+        }})
+        requests.append({"updateCells": {
+            "start": {"sheetId": dash_id, "rowIndex": 0, "columnIndex": 0},
+            "rows": rows,
+            "fields": "userEnteredValue,userEnteredFormat"
+        }})
+
+        # 3. Native pie chart over the aggregation table (A6:B)
+        if totals:
+            first_row, last_row = 5, 5 + len(totals)
+            requests.append({"addChart": {"chart": {
+                "spec": {
+                    "title": "Gastos por Categoría",
+                    "pieChart": {
+                        "legendPosition": "RIGHT_LEGEND",
+                        "pieHole": 0.4,
+                        "domain": {"sourceRange": {"sources": [{
+                            "sheetId": dash_id, "startRowIndex": first_row, "endRowIndex": last_row,
+                            "startColumnIndex": 0, "endColumnIndex": 1
+                        }]}},
+                        "series": {"sourceRange": {"sources": [{
+                            "sheetId": dash_id, "startRowIndex": first_row, "endRowIndex": last_row,
+                            "startColumnIndex": 1, "endColumnIndex": 2
+                        }]}},
+                    }
+                },
+                "position": {"overlayPosition": {
+                    "anchorCell": {"sheetId": dash_id, "rowIndex": 4, "columnIndex": 3}
+                }}
+            }}})
+
+        # 4. Remember what we built
+        if stored:
+            requests.append({"updateDeveloperMetadata": {
+                "dataFilters": [{"developerMetadataLookup": {"metadataId": stored["metadataId"]}}],
+                "developerMetadata": {"metadataValue": fingerprint},
+                "fields": "metadataValue"
+            }})
+        else:
+            requests.append({"createDeveloperMetadata": {"developerMetadata": {
+                "metadataKey": DASHBOARD_FINGERPRINT_KEY,
+                "metadataValue": fingerprint,
+                "location": {"sheetId": dash_id},
+                "visibility": "DOCUMENT"
+            }}})
+
+        ss.batch_update({"requests": requests})
+
+        print(f"Dashboard {DASHBOARD_NAME} updated.")
         return True
 
     except Exception as e:
         print(f"Error creating chart: {e}")
-        import traceback
         traceback.print_exc()
         return False
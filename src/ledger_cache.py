@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Read-your-writes cache of the pending (unclassified) part of each ledger.
+#
+# Writes that succeed in this process (appends, category changes) are applied here
+# right away, tagged with the data version they produced, so the digest that follows
+# an insert or a classification is served from memory instead of re-reading Sheets.
+#
+# Staleness is bounded: an entry not reconciled with Sheets for MAX_STALENESS seconds
+# is not served, and the bot reconciles the ledgers it uses every REFRESH_INTERVAL in
+# the background. That is how writes from other processes (the dashboard, edits by
+# hand) show up. A reconcile that finds the same data version only renews the entry.
+#
+# Local writes are also kept in a short log. When an entry is reloaded from Sheets,
+# writes newer than the version that was read are replayed on top, so a write that
+# lands while the reload is in flight is not lost. A local write never marks the
+# entry as synced at its own version (we can't tell whether someone else wrote
+# just before it), so the next reconcile after it reloads.
+
+MAX_STALENESS = int(os.environ.get("CACHE_MAX_STALENESS", 300))       # seconds
+REFRESH_INTERVAL = int(os.environ.get("CACHE_REFRESH_INTERVAL", 120))  # seconds
+LOG_SIZE = 1000  # local writes remembered per ledger for replay
+
+COLUMNS = ["id", "date", "month", "year", "amount", "description", "category", "source", "status"]
+
+_lock = threading.Lock()
+_entries = {}  # spreadsheet_id -> {"version": int, "synced_at": monotonic, "pending": OrderedDict(id -> row dict | None)}
+_log = {}      # spreadsheet_id -> deque[(version, op, args)]
+
+def _apply(entry, op, args):
+    if op == "append":
+        for row in args:
+            if row["status"] == "pending_classification":
+                entry["pending"].setdefault(row["id"], row)
+    elif op == "classify":
+        for txn_id in args:
+            entry["pending"].pop(txn_id, None)
+
+def _record(spreadsheet_id, version, op, args):
+    version = version or 0
+    with _lock:
+        _log.setdefault(spreadsheet_id, deque(maxlen=LOG_SIZE)).append((version, op, args))
+        entry = _entries.get(spreadsheet_id)
+        if entry is not None:
+            # The entry's version is left alone: another process may have written
+            # between the version we read and this one, so only a reload (which
+            # replays this write from the log) may move it forward
+            _apply(entry, op, args)
+
+def record_append(spreadsheet_id, rows, version):
+    """Apply V2 rows (lists) that were just appended to Sheets."""
+    _record(spreadsheet_id, version, "append", [dict(zip(COLUMNS, row)) for row in rows])
+
+def record_classification(spreadsheet_id, txn_ids, version):
+    """Apply a category change (it also marks the rows as verified)."""
+    _record(spreadsheet_id, version, "classify", [str(t) for t in txn_ids])
+
+def pending(spreadsheet_id, limit):
+    """
+    (pending ids in sheet order, the first `limit` pending rows) from memory, or None
+    if the ledger is not cached, is too stale, or lacks some of those rows.
+    """
+    with _lock:
+        entry = _entries.get(spreadsheet_id)
+        if entry is None or time.monotonic() - entry["synced_at"] > MAX_STALENESS:
+            return None
+        ids = list(entry["pending"])
+        rows = [entry["pending"][i] for i in ids[:limit]]
+        if any(row is None for row in rows):
+            return None
+        return ids, [dict(row) for row in rows]
+
+def renew(spreadsheet_id, data_version):
+    """
+    Mark the entry as reconciled if Sheets is still at the version we know.
+    Returns False when the entry must be reloaded.
+    """
+    with _lock:
+        entry = _entries.get(spreadsheet_id)
+        if entry is None or not data_version or data_version != entry["version"]:
+            return False
+        entry["synced_at"] = time.monotonic()
+        return True
+
+def load(spreadsheet_id, data_version, pending_ids, rows):
+    """
+    Replace the entry with what was read from Sheets at data_version: every pending
+    id in sheet order and the rows fetched for some of them (dicts with an 'id').
+    """
+    entry = {
+        "version": data_version or 0,
+        "synced_at": time.monotonic(),
+        "pending": OrderedDict((str(i), None) for i in pending_ids),
+    }
+    for row in rows:
+        if str(row["id"]) in entry["pending"]:
+            entry["pending"][str(row["id"])] = row
+    with _lock:
+        for version, op, args in _log.get(spreadsheet_id, ()):
+            if not data_version or version > data_version:
+                _apply(entry, op, args)
+        _entries[spreadsheet_id] = entry
+
+def ledgers():
+    """Spreadsheet ids with a cache entry (None = default ledger)."""
+    with _lock:
+        return list(_entries)
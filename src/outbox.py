@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+
+import db
+import tenants
+
+# Local write-ahead outbox for new transactions.
+#
+# Every transaction is appended (and fsync'd) to a JSON-lines journal before the
+# user gets an acknowledgement. A background replayer drains the journal to Sheets
+# in batches and appends an "ack" record for what was written. On restart the
+# journal is replayed, so nothing acknowledged to the user is lost during API
+# outages or crashes.
+#
+# Journal records:
+#   {"op": "add",  "seq": 1, "row": [...], "chat_id": 123, "spreadsheet_id": "..."}
+#                  (+ "attempts" / "error" when rewritten by compaction)
+#   {"op": "ack",  "seq": 1}
+#   {"op": "fail", "seq": 1, "error": "..."}
+#   {"op": "retry", "seq": 1}  (manual retry of a parked entry, resets attempts)
+
+OUTBOX_FILE = os.environ.get(
+    "OUTBOX_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "outbox.jsonl")
+)
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5  # after this many failures an entry is parked as "failed"
+# Rewrite the journal once it has this many lines and at least half are dead
+COMPACT_MIN_LINES = 1000
+
+_lock = threading.Lock()        # guards the journal file and _entries
+_drain_lock = threading.Lock()  # only one replayer at a time
+_entries = None                 # seq -> {"seq", "row", "chat_id", "attempts", "error"} (not yet acked)
+_uncertain = set()              # seqs whose write may have reached Sheets (crash / timeout)
+_next_seq = 1
+_lines = 0                      # records in the journal file
+
+def _append(record):
+    global _lines
+    os.makedirs(os.path.dirname(OUTBOX_FILE), exist_ok=True)
+    with open(OUTBOX_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _lines += 1
+
+def _load():
+    """Rebuild the in-memory state from the journal (once per process)."""
+    global _entries, _next_seq, _lines
+    if _entries is not None:
+        return
+    _entries = {}
+    if os.path.exists(OUTBOX_FILE):
+        with open(OUTBOX_FILE, "rb") as f:
+            data = f.read()
+        # A crash mid-write leaves a last line with no newline (the user never got an
+        # ack for it). Cut it off before anything is appended, or the next record
+        # would be glued onto the fragment and lost on the following restart.
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            with open(OUTBOX_FILE, "r+b") as f:
+                f.truncate(complete)
+                f.flush()
+                os.fsync(f.fileno())
+        for line in data[:complete].decode("utf-8", errors="replace").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Journals torn before the cut above existed: a fragment with the next
+                # record written right after it on the same line
+                start = line.rfind('{"op"')
+                try:
+                    record = json.loads(line[start:]) if start > 0 else None
+                except ValueError:
+                    record = None
+                if record is None:
+                    continue
+            _lines += 1
+            seq = record["seq"]
+            _next_seq = max(_next_seq, seq + 1)
+            if record["op"] == "add":
+                _entries[seq] = {"seq": seq, "row": record["row"], "chat_id": record.get("chat_id"),
+                                 "attempts": record.get("attempts", 0), "error": record.get("error")}
+                if "spreadsheet_id" in record:
+                    _entries[seq]["spreadsheet_id"] = record["spreadsheet_id"]
+            elif record["op"] == "ack":
+                _entries.pop(seq, None)
+            elif record["op"] == "fail" and seq in _entries:
+                _entries[seq]["attempts"] += 1
+                _entries[seq]["error"] = record.get("error")
+            elif record["op"] == "retry" and seq in _entries:
+                _entries[seq]["attempts"] = 0
+    # We can't know whether these made it to Sheets before the process stopped
+    _uncertain.update(_entries)
+
+def _compact():
+    """
+    Rewrite the journal with only the live entries (attempts and error included),
+    when it is all acknowledged or mostly dead lines. Parked entries no longer keep
+    every old add/ack line around.
+    """
+    global _lines
+    if _entries and (_lines < COMPACT_MIN_LINES or _lines < 2 * len(_entries)):
+        return
+    tmp_path = OUTBOX_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for e in sorted(_entries.values(), key=lambda e: e["seq"]):
+            record = {"op": "add", "seq": e["seq"], "row": e["row"], "chat_id": e["chat_id"],
+                      "attempts": e["attempts"], "error": e["error"]}
+            if "spreadsheet_id" in e:
+                record["spreadsheet_id"] = e["spreadsheet_id"]
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, OUTBOX_FILE)
+    _lines = len(_entries)
+
+def enqueue(row, chat_id=None, spreadsheet_id=None):
+    """
+    Durably record a new transaction row for the given ledger (None = default).
+    The ledger is fixed here, so a later /hoja change doesn't redirect the row.
+    Returns its sequence number.
+    """
+    global _next_seq
+    with _lock:
+        _load()
+        seq = _next_seq
+        _next_seq += 1
+        _append({"op": "add", "seq": seq, "row": row, "chat_id": chat_id, "spreadsheet_id": spreadsheet_id})
+        _entries[seq] = {"seq": seq, "row": row, "chat_id": chat_id, "spreadsheet_id": spreadsheet_id, "attempts": 0, "error": None}
+        return seq
+
+def _target(entry):
+    """Ledger of an entry; journals written before it was recorded use the chat's current one."""
+    if "spreadsheet_id" in entry:
+        return entry["spreadsheet_id"]
+    return tenants.get_spreadsheet(entry["chat_id"]) if entry["chat_id"] is not None else None
+
+def _of(chat_id):
+    """Entries enqueued by chat_id (every entry when chat_id is None)."""
+    return [e for e in _entries.values() if chat_id is None or e["chat_id"] == chat_id]
+
+def pending(chat_id=None):
+    """Entries still waiting to be written to Sheets."""
+    with _lock:
+        _load()
+        return [dict(e) for e in _of(chat_id) if e["attempts"] < MAX_ATTEMPTS]
+
+def failed(chat_id=None):
+    """Entries that failed MAX_ATTEMPTS times and are no longer retried automatically."""
+    with _lock:
+        _load()
+        return [dict(e) for e in _of(chat_id) if e["attempts"] >= MAX_ATTEMPTS]
+
+def rows_for(spreadsheet_id):
+    """Rows bound for a ledger that are not in Sheets yet (waiting or failed)."""
+    with _lock:
+        _load()
+        return [list(e["row"]) for e in _entries.values() if _target(e) == spreadsheet_id]
+
+def retry_failed(chat_id=None):
+    """Give failed entries a fresh set of attempts. Returns how many were reset."""
+    with _lock:
+        _load()
+        parked = [e for e in _of(chat_id) if e["attempts"] >= MAX_ATTEMPTS]
+        for e in parked:
+            _append({"op": "retry", "seq": e["seq"]})
+            e["attempts"] = 0
+        return len(parked)
+
+def _send(batch, spreadsheet_id):
+    """Write one tenant's batch. Returns True on success, records the failure otherwise."""
+    try:
+        to_send = batch
+        if any(e["seq"] in _uncertain for e in batch):
+            # Don't duplicate rows that already landed before a crash/timeout
+            existing = db.get_transaction_ids(spreadsheet_id=spreadsheet_id)
+            to_send = [e for e in batch if e["row"][0] not in existing]
+        if to_send and not db.append_transactions([e["row"] for e in to_send], spreadsheet_id=spreadsheet_id):
+            raise RuntimeError("append_rows failed")
+    except Exception as e:
+        print(f"Outbox: error writing {len(batch)} entries: {e}")
+        with _lock:
+            for entry in batch:
+                _append({"op": "fail", "seq": entry["seq"], "error": str(e)})
+                if entry["seq"] in _entries:
+                    _entries[entry["seq"]]["attempts"] += 1
+                    _entries[entry["seq"]]["error"] = str(e)
+                _uncertain.add(entry["seq"])
+            _compact()
+        return False
+
+    with _lock:
+        for entry in batch:
+            _append({"op": "ack", "seq": entry["seq"]})
+            _entries.pop(entry["seq"], None)
+            _uncertain.discard(entry["seq"])
+        _compact()
+    return True
+
+def drain():
+    """
+    Write pending entries to Sheets in batches. Returns the entries that were written.
+    Entries are queued per tenant (chat): a tenant that fails or is over its
+    request budget is skipped for this run without holding back the others.
+    Blocking (gspread is synchronous): run it off the event loop.
+    """
+    if not _drain_lock.acquire(blocking=False):
+        return []
+    written = []
+    skipped = set()
+    try:
+        while True:
+            with _lock:
+                _load()
+                ready = [e for e in sorted(_entries.values(), key=lambda e: e["seq"])
+                         if e["attempts"] < MAX_ATTEMPTS and e["chat_id"] not in skipped]
+            if not ready:
+                break
+
+            # One queue per tenant and target ledger (a batch goes to a single sheet)
+            queues = {}
+            for entry in ready:
+                queues.setdefault((entry["chat_id"], _target(entry)), []).append(entry)
+
+            for (chat_id, spreadsheet_id), queue in queues.items():
+                if chat_id in skipped:
+                    continue
+                batch = queue[:BATCH_SIZE]
+                if chat_id is not None and not tenants.try_acquire(chat_id):
+                    skipped.add(chat_id)
+                    continue
+                if _send(batch, spreadsheet_id):
+                    written.extend(batch)
+                else:
+                    skipped.add(chat_id)
+    finally:
+        _drain_lock.release()
+
+    if written:
+        print(f"Outbox: {len(written)} entries written to Sheets.")
+    return written
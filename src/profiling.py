@@ -0,0 +1,170 @@
+import contextvars
+import functools
+import io
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in profiling for bot handlers and the dashboard render.
+#
+#   PROFILING=1              stage spans (fetch / transform / render / send) + latency histograms
+#   PROFILE_SAMPLE_RATE=0.1  fraction of requests run under cProfile, report dumped per request
+#   PROFILE_MEMORY=1         also diff tracemalloc snapshots for sampled requests
+#   PROFILE_DIR=profiles     where per-request reports are written
+#   SLOW_REQUEST_MS=2000     requests slower than this are logged with their spans
+#
+# With neither PROFILING nor PROFILE_SAMPLE_RATE set, `profiled` returns the handler
+# unchanged and `request` is an empty context manager.
+
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+ENABLED = os.environ.get("PROFILING", "0") == "1" or SAMPLE_RATE > 0
+MEMORY = os.environ.get("PROFILE_MEMORY", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 2000))
+
+# Histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf")]
+
+_lock = threading.Lock()
+_histograms = {}  # "handler" or "handler.stage" -> {"counts": [...], "count": n, "sum": ms}
+_current = contextvars.ContextVar("profiling_trace", default=None)
+_sampling = threading.Lock()  # cProfile allows one active profiler per process
+
+def _observe(key, ms):
+    with _lock:
+        h = _histograms.setdefault(key, {"counts": [0] * len(BUCKETS_MS), "count": 0, "sum": 0.0})
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                h["counts"][i] += 1
+                break
+        h["count"] += 1
+        h["sum"] += ms
+
+def _quantile(h, q):
+    """Upper bucket bound containing the q-quantile."""
+    target = q * h["count"]
+    seen = 0
+    for bound, count in zip(BUCKETS_MS, h["counts"]):
+        seen += count
+        if seen >= target:
+            return bound
+    return BUCKETS_MS[-1]
+
+@contextmanager
+def span(stage):
+    """Time one stage of the current request (no-op outside a profiled request)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        trace["spans"].append((stage, ms))
+        _observe(f"{trace['name']}.{stage}", ms)
+
+def _start(name):
+    trace = {"name": name, "spans": [], "start": time.perf_counter(), "profiler": None, "snapshot": None, "tracing": False}
+    if SAMPLE_RATE and random.random() < SAMPLE_RATE and _sampling.acquire(blocking=False):
+        # Async handlers interleave, so a sampled report can include other requests' work
+        import cProfile
+        trace["profiler"] = cProfile.Profile()
+        trace["profiler"].enable()
+        if MEMORY:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                # Ours to stop: tracing slows down every allocation in the process
+                trace["tracing"] = True
+            trace["snapshot"] = tracemalloc.take_snapshot()
+    return trace
+
+def _finish(trace):
+    total_ms = (time.perf_counter() - trace["start"]) * 1000
+    _observe(trace["name"], total_ms)
+
+    if trace["profiler"] is not None:
+        trace["profiler"].disable()
+        try:
+            _dump(trace, total_ms)
+        finally:
+            if trace["tracing"]:
+                import tracemalloc
+                tracemalloc.stop()
+            _sampling.release()
+
+    if total_ms >= SLOW_REQUEST_MS:
+        stages = ", ".join(f"{stage}={ms:.0f}ms" for stage, ms in trace["spans"])
+        print(f"🐢 Slow request: {trace['name']} took {total_ms:.0f}ms ({stages})")
+
+def _dump(trace, total_ms):
+    """Write the cProfile (and tracemalloc) report of one sampled request."""
+    import pstats
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    out = io.StringIO()
+    out.write(f"{trace['name']} - {total_ms:.1f} ms\n")
+    for stage, ms in trace["spans"]:
+        out.write(f"  {stage}: {ms:.1f} ms\n")
+    out.write("\n")
+    pstats.Stats(trace["profiler"], stream=out).sort_stats("cumulative").print_stats(30)
+
+    if trace["snapshot"] is not None:
+        import tracemalloc
+        out.write("\nTop allocations:\n")
+        for stat in tracemalloc.take_snapshot().compare_to(trace["snapshot"], "lineno")[:15]:
+            out.write(f"  {stat}\n")
+
+    path = os.path.join(PROFILE_DIR, f"{trace['name']}_{int(time.time() * 1000)}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+
+@contextmanager
+def request(name):
+    """Profile a synchronous request (e.g. one Streamlit run of the dashboard)."""
+    if not ENABLED:
+        yield
+        return
+    trace = _start(name)
+    token = _current.set(trace)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        _finish(trace)
+
+def profiled(name):
+    """Decorator for async bot handlers: one profiled request per call."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            trace = _start(name)
+            token = _current.set(trace)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _current.reset(token)
+                _finish(trace)
+        return wrapper
+    return decorator
+
+def report():
+    """Text summary of the latency histograms: count, mean, p50, p95, p99 per key."""
+    with _lock:
+        snapshot = {k: dict(v) for k, v in _histograms.items()}
+    if not snapshot:
+        return "No profiling data (set PROFILING=1)."
+    lines = [f"{'key':40} {'count':>7} {'mean':>9} {'p50':>8} {'p95':>8} {'p99':>8}"]
+    for key in sorted(snapshot):
+        h = snapshot[key]
+        mean = h["sum"] / h["count"] if h["count"] else 0
+        lines.append(
+            f"{key:40} {h['count']:>7} {mean:>7.1f}ms {_quantile(h, 0.5):>6}ms {_quantile(h, 0.95):>6}ms {_quantile(h, 0.99):>6}ms"
+        )
+    return "\n".join(lines)
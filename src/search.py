@@ -0,0 +1,163 @@
+import bisect
+import os
+import re
+import threading
+import time
+import unicodedata
+
+# Inverted index over transaction descriptions and sources.
+#
+# Tokens are accent-folded and lower-cased ("Educación" -> "educacion"), so queries
+# match regardless of accents. Every query term is a prefix ("netf" finds "Netflix")
+# and terms are ANDed. Lookups go through a sorted vocabulary (bisect) and posting
+# sets, so query time depends on the number of matches, not on the ledger size.
+#
+# The index is kept per ledger and updated incrementally: db write paths call
+# index_row / set_category, and sync() adds only the rows it has not seen yet.
+# sync() records the data version it read at: an index filled only by local writes
+# (or synced at an older version) is not synced, see is_synced(). When the latest
+# version is one this process wrote, its rows are already indexed, so a sync is
+# only due once the last one is MAX_STALENESS old (other writers may have come
+# in between without us seeing their version).
+
+MAX_STALENESS = int(os.environ.get("SEARCH_MAX_STALENESS", 300))  # seconds
+
+_lock = threading.Lock()
+_indexes = {}  # ledger -> {"postings": {token: set(ids)}, "vocab": [sorted tokens], "docs": {id: doc}, "version": int | None, "synced_at": monotonic}
+
+def fold(text):
+    """Lower-case and strip accents."""
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", fold(text))
+
+def _index(ledger):
+    return _indexes.setdefault(ledger, {"postings": {}, "vocab": [], "docs": {}, "version": None, "synced_at": 0.0})
+
+def _add(idx, txn_id, date, amount, description, source, category):
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        amount = 0.0
+    idx["docs"][txn_id] = {
+        "id": txn_id, "date": str(date), "amount": amount,
+        "description": description, "source": source, "category": category,
+    }
+    for token in set(tokenize(description) + tokenize(source)):
+        posting = idx["postings"].get(token)
+        if posting is None:
+            idx["postings"][token] = posting = set()
+            bisect.insort(idx["vocab"], token)
+        posting.add(txn_id)
+
+def index_row(ledger, row):
+    """Index one V2 row (id, date, month, year, amount, description, category, source, status)."""
+    with _lock:
+        idx = _index(ledger)
+        if row[0] not in idx["docs"]:
+            _add(idx, row[0], row[1], row[4], row[5], row[7], row[6])
+
+def set_category(ledger, txn_ids, category):
+    """Keep the stored category in sync after a classification."""
+    with _lock:
+        docs = _index(ledger)["docs"]
+        for txn_id in txn_ids:
+            if str(txn_id) in docs:
+                docs[str(txn_id)]["category"] = category
+
+def sync(ledger, df, data_version=None):
+    """
+    Index the rows of df (read at data_version) that are not in the index yet and
+    refresh the category of the others. Returns how many were added.
+    """
+    with _lock:
+        idx = _index(ledger)
+        docs = idx["docs"]
+        new = []
+        for i, (txn_id, category) in enumerate(zip(df["id"].astype(str).tolist(), df["category"].tolist())):
+            doc = docs.get(txn_id)
+            if doc is None:
+                new.append(i)
+            elif doc["category"] != category:
+                # Classified elsewhere (dashboard, by hand)
+                doc["category"] = category
+        new_rows = df.iloc[new]
+        for txn_id, date, amount, description, source, category in zip(
+            new_rows["id"].astype(str), new_rows["date"], new_rows["amount"],
+            new_rows["description"], new_rows["source"], new_rows["category"]
+        ):
+            _add(idx, txn_id, date, amount, description, source, category)
+        idx["version"] = data_version
+        idx["synced_at"] = time.monotonic()
+        return len(new_rows)
+
+def is_synced(ledger, data_version, written_version=None):
+    """
+    True if the index is up to date with Sheets at data_version: it was synced at
+    that version, or that version is our own last write (written_version) and the
+    last sync is recent enough.
+    """
+    with _lock:
+        idx = _index(ledger)
+        if not data_version or idx["version"] is None:
+            return False
+        if idx["version"] == data_version:
+            return True
+        return data_version == written_version and time.monotonic() - idx["synced_at"] <= MAX_STALENESS
+
+def _prefix_ids(idx, prefix):
+    vocab = idx["vocab"]
+    matches = set()
+    i = bisect.bisect_left(vocab, prefix)
+    while i < len(vocab) and vocab[i].startswith(prefix):
+        matches |= idx["postings"][vocab[i]]
+        i += 1
+    return matches
+
+def query(ledger, text, min_amount=None, max_amount=None, date_from=None, date_to=None, limit=50):
+    """
+    Transactions matching every term of `text` (prefix match), newest first.
+    Dates are compared as 'YYYY-MM-DD...' strings, so prefixes like '2026-10' work.
+    """
+    terms = tokenize(text)
+    with _lock:
+        idx = _index(ledger)
+        if terms:
+            ids = None
+            # Rarest-looking (longest) prefixes first keeps the intersections small
+            for term in sorted(terms, key=len, reverse=True):
+                found = _prefix_ids(idx, term)
+                ids = found if ids is None else ids & found
+                if not ids:
+                    return []
+        else:
+            ids = idx["docs"].keys()
+        docs = [idx["docs"][i] for i in ids]
+
+    if min_amount is not None:
+        docs = [d for d in docs if d["amount"] >= min_amount]
+    if max_amount is not None:
+        docs = [d for d in docs if d["amount"] <= max_amount]
+    if date_from:
+        docs = [d for d in docs if d["date"][:len(date_from)] >= date_from]
+    if date_to:
+        docs = [d for d in docs if d["date"][:len(date_to)] <= date_to]
+    docs.sort(key=lambda d: d["date"], reverse=True)
+    return docs[:limit]
+
+def parse_query(args):
+    """
+    Split bot-style arguments into text and filters:
+    '>50' / '<100' = amount range, '2026-10' or '2026-10-05' = date prefix.
+    """
+    text, filters = [], {}
+    for arg in args:
+        if re.fullmatch(r"[<>]\d+(\.\d+)?", arg):
+            filters["min_amount" if arg[0] == ">" else "max_amount"] = float(arg[1:])
+        elif re.fullmatch(r"\d{4}-\d{2}(-\d{2})?", arg):
+            filters["date_from"] = filters["date_to"] = arg
+        else:
+            text.append(arg)
+    return " ".join(text), filters
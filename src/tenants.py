@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+
+# Tenant registry: every chat that talked to the bot (via /start or a message) is a
+# tenant. It gets the periodic digest and can be routed to its own spreadsheet with
+# /hoja. The default ledger (gsheets.SPREADSHEET_ID) belongs to the owner: only the
+# chats in OWNER_CHAT_ID (comma-separated ids) use it; any other chat has no ledger
+# until it sets one with /hoja.
+# Stored as a small JSON file next to the other local data: {"<chat_id>": {"spreadsheet_id": ...}}
+CHATS_FILE = os.environ.get(
+    "CHATS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "chats.json")
+)
+
+# Per-tenant Sheets budget, so one busy chat can't exhaust the shared quota
+TENANT_REQUESTS_PER_MINUTE = int(os.environ.get("TENANT_REQUESTS_PER_MINUTE", 30))
+TENANT_BURST = int(os.environ.get("TENANT_BURST", 10))
+# A whole-ledger read (get_transactions_df) counts as this many requests
+FULL_READ_COST = int(os.environ.get("TENANT_FULL_READ_COST", 5))
+
+OWNER_CHAT_IDS = {int(c) for c in os.environ.get("OWNER_CHAT_ID", "").split(",") if c.strip()}
+
+_lock = threading.Lock()
+_registry = None  # chat_id -> {"spreadsheet_id": str | None}
+_buckets = {}     # chat_id -> (tokens, last_refill)
+
+def _load():
+    global _registry
+    if _registry is not None:
+        return
+    _registry = {}
+    if not os.path.exists(CHATS_FILE):
+        return
+    try:
+        with open(CHATS_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            # Old format: plain list of chat ids
+            data = {str(c): {} for c in data}
+        _registry = {int(c): {"spreadsheet_id": cfg.get("spreadsheet_id")} for c, cfg in data.items()}
+    except Exception as e:
+        print(f"Error reading {CHATS_FILE}: {e}")
+
+def _save():
+    os.makedirs(os.path.dirname(CHATS_FILE), exist_ok=True)
+    tmp_path = CHATS_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({str(c): cfg for c, cfg in _registry.items()}, f)
+    os.replace(tmp_path, CHATS_FILE)
+
+def load_chats():
+    """Return the list of registered chat ids."""
+    with _lock:
+        _load()
+        return list(_registry)
+
+def register_chat(chat_id):
+    """Register a chat as a tenant. Returns True if it was not registered before."""
+    with _lock:
+        _load()
+        if chat_id in _registry:
+            return False
+        _registry[chat_id] = {"spreadsheet_id": None}
+        _save()
+        return True
+
+def get_spreadsheet(chat_id):
+    """Spreadsheet id for a chat, or None for the default ledger."""
+    with _lock:
+        _load()
+        return _registry.get(chat_id, {}).get("spreadsheet_id")
+
+def has_ledger(chat_id):
+    """True if the chat has its own spreadsheet or is allowed on the default ledger."""
+    return chat_id in OWNER_CHAT_IDS or get_spreadsheet(chat_id) is not None
+
+def chats_for(spreadsheet_id):
+    """Chats whose ledger is spreadsheet_id (None = the default ledger)."""
+    with _lock:
+        _load()
+        return [c for c, cfg in _registry.items()
+                if cfg.get("spreadsheet_id") == spreadsheet_id and (spreadsheet_id or c in OWNER_CHAT_IDS)]
+
+def set_spreadsheet(chat_id, spreadsheet_id):
+    """Route a chat to its own spreadsheet (None = back to the default ledger)."""
+    with _lock:
+        _load()
+        _registry[chat_id] = {"spreadsheet_id": spreadsheet_id}
+        _save()
+
+def claim_spreadsheet(chat_id, spreadsheet_id):
+    """
+    Route a chat to its own spreadsheet unless another chat already uses it.
+    Returns False (and changes nothing) if the spreadsheet belongs to another chat.
+    """
+    with _lock:
+        _load()
+        if any(c != chat_id and cfg.get("spreadsheet_id") == spreadsheet_id for c, cfg in _registry.items()):
+            return False
+        _registry[chat_id] = {"spreadsheet_id": spreadsheet_id}
+        _save()
+        return True
+
+def try_acquire(chat_id, cost=1):
+    """
+    Token bucket per tenant. Returns True and consumes `cost` requests if the chat
+    is within its Sheets budget, False otherwise (callers skip or retry later).
+    """
+    rate = TENANT_REQUESTS_PER_MINUTE / 60.0
+    now = time.monotonic()
+    with _lock:
+        tokens, last = _buckets.get(chat_id, (TENANT_BURST, now))
+        tokens = min(TENANT_BURST, tokens + (now - last) * rate)
+        if tokens < cost:
+            _buckets[chat_id] = (tokens, now)
+            return False
+        _buckets[chat_id] = (tokens - cost, now)
+        return True
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+import analysis
+
+COLUMNS = ["id", "date", "month", "year", "amount", "description", "category", "source", "status"]
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(analysis, "_cache", {})
+
+
+def _ledger(months, amount=39.9):
+    rows = [[f"txn_{m}", f"2026-{m:02d}-05 10:00:00", f"{m:02d}", "2026", amount, "Netflix", "Ocio", "BCP", "verified"]
+            for m in months]
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def test_appended_rows_match_a_full_run():
+    analysis.recurring(_ledger(range(1, 4)), data_version=1)
+    df = _ledger(range(1, 7))
+    incremental = analysis.recurring(df, data_version=2)
+
+    analysis._cache.clear()
+    pd.testing.assert_frame_equal(incremental, analysis.recurring(df, data_version=2), check_dtype=False)
+    assert incremental["occurrences"].tolist() == [6]
+
+
+def test_edit_in_place_recomputes():
+    assert analysis.recurring(_ledger(range(1, 5)), data_version=1)["amount"].tolist() == [39.9]
+    # Same ids and row count, amounts edited (new data version)
+    assert analysis.recurring(_ledger(range(1, 5), amount=44.9), data_version=2)["amount"].tolist() == [44.9]
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import budgets
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(budgets, "BUDGETS_FILE", str(tmp_path / "budgets.json"))
+    monkeypatch.setattr(budgets, "_state", None)
+    monkeypatch.setattr(budgets, "_alerts", {})
+
+
+def _ledger_df(n):
+    return pd.DataFrame({
+        "id": [f"txn_{i}" for i in range(n)],
+        "month": ["10"] * n,
+        "year": ["2026"] * n,
+        "amount": [1.5] * n,
+        "category": ["Comida"] * n,
+    })
+
+
+def _row(i):
+    return [f"new_{i}", "2026-10-19 12:00:00", "10", "2026", 2.0, "Taxi", "Transporte", "Telegram Bot", "pending_classification"]
+
+
+def _insert_cost(ledger, size, inserts=2000):
+    budgets.rebuild(ledger, _ledger_df(size))
+    start = time.perf_counter()
+    for i in range(inserts):
+        budgets.record_insert(ledger, _row(i))
+    return (time.perf_counter() - start) / inserts
+
+
+def test_insert_does_not_touch_the_file(monkeypatch):
+    budgets.set_budget("sheet", "Transporte", 100)
+    budgets.rebuild("sheet", _ledger_df(1000))
+    saves = []
+    monkeypatch.setattr(budgets, "_save", lambda: saves.append(1))
+
+    budgets.record_insert("sheet", _row(0))
+    budgets.record_category_change("sheet", ["new_0"], "Comida")
+
+    assert saves == []
+    assert budgets.status("sheet", "2026-10") == [("Transporte", 0, 10000)]
+
+
+def test_insert_cost_and_file_size_do_not_grow_with_the_ledger():
+    budgets.set_budget("small", "Comida", 100)
+    budgets.set_budget("large", "Comida", 100)
+    small = _insert_cost("small", 1_000)
+    large = _insert_cost("large", 100_000)
+
+    # Same work per insert whatever the ledger size (generous bound for noisy machines)
+    assert large < small * 5 + 20e-6
+    # Only the budgets are persisted, not the 100k-row index
+    assert os.path.getsize(budgets.BUDGETS_FILE) < 200
+
+
+def test_unbuilt_ledger_leaves_inserts_for_the_rebuild():
+    budgets.record_insert("sheet", _row(0))
+    assert not budgets.is_built("sheet")
+
+    budgets.rebuild("sheet", _ledger_df(2))
+    budgets.record_insert("sheet", _row(0))
+    budgets.record_insert("sheet", _row(0))
+    assert budgets._ledger("sheet")["totals"]["2026-10"] == {"Comida": 300, "Transporte": 200}
+
+
+def test_budgets_survive_a_restart(monkeypatch):
+    budgets.set_budget(None, "Comida", 50.25)
+    budgets.rebuild(None, _ledger_df(10))
+    monkeypatch.setattr(budgets, "_state", None)
+
+    assert budgets.status(None, "2026-10") == [("Comida", 0, 5025)]
+    assert not budgets.is_built(None)
+
+
+def test_rebuild_replays_writes_made_while_reading():
+    budgets.rebuild("sheet", _ledger_df(2))
+    budgets.begin_rebuild("sheet")
+    # Recorded while the ledger read is in flight (the read below misses them)
+    budgets.record_insert("sheet", _row(0))
+    budgets.record_category_change("sheet", ["txn_0"], "Otros")
+    budgets.rebuild("sheet", _ledger_df(2), data_version=7, queued_rows=[_row(1)])
+    budgets.end_rebuild("sheet")
+
+    assert budgets._ledger("sheet")["totals"]["2026-10"] == {"Comida": 150, "Otros": 150, "Transporte": 400}
+    assert budgets.synced_version("sheet") == 7
+
+
+def test_rebuild_alerts_on_changes_made_elsewhere():
+    budgets.set_budget("sheet", "Comida", 4)
+    budgets.rebuild("sheet", _ledger_df(2))
+    assert budgets.pop_alerts("sheet") == []
+
+    # Another process classified a third row as Comida: 4.50 of 4.00
+    budgets.rebuild("sheet", _ledger_df(3))
+    alerts = budgets.pop_alerts("sheet")
+    assert len(alerts) == 1 and "Comida" in alerts[0] and "112%" in alerts[0]
+
+    budgets.rebuild("sheet", _ledger_df(3))
+    assert budgets.pop_alerts("sheet") == []
+
+
+def test_insert_during_the_first_build_is_alerted():
+    # Right after a restart: the startup rebuild is reading the ledger
+    budgets.set_budget("sheet", "Transporte", 2)
+    budgets.begin_rebuild("sheet")
+    budgets.record_insert("sheet", _row(0))
+    budgets.rebuild("sheet", _ledger_df(2))
+    budgets.end_rebuild("sheet")
+
+    alerts = budgets.pop_alerts("sheet")
+    assert len(alerts) == 1 and "Transporte" in alerts[0] and "100%" in alerts[0]
@@ -0,0 +1,40 @@
+import pytest
+
+import callbacks
+
+
+@pytest.fixture(autouse=True)
+def fresh_table(monkeypatch):
+    monkeypatch.setattr(callbacks, "_table", {})
+    monkeypatch.setattr(callbacks, "_expiry", [])
+
+
+def test_round_trip_keeps_txn_ids_whole():
+    # The old 'cat_{id}_{cat}' format split 'txn_..._...' ids on '_'
+    payload = {"id": "txn_1729340000000", "similar": ["txn_1729340000000", "txn_1729340000123"]}
+    data = callbacks.encode("s", callbacks.issue(payload), 4)
+
+    assert len(data.encode("utf-8")) <= callbacks.CALLBACK_DATA_LIMIT
+    assert callbacks.decode(data) == ("s", payload, ["4"])
+
+
+def test_navigation_without_token():
+    assert callbacks.decode(callbacks.encode("p", "", 3, 7)) == ("p", None, ["3", "7"])
+
+
+def test_encode_rejects_data_past_the_limit():
+    with pytest.raises(ValueError):
+        callbacks.encode("c", "x" * 70)
+
+
+def test_expired_tokens_are_pruned(monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(callbacks.time, "time", lambda: now)
+    old = callbacks.issue({"id": "txn_1"}, ttl=10)
+
+    now += 11
+    fresh = callbacks.issue({"id": "txn_2"}, ttl=10)
+
+    assert callbacks.decode(f"c:{old}:0")[1] is None
+    assert old not in callbacks._table
+    assert callbacks.decode(f"c:{fresh}:0")[1] == {"id": "txn_2"}
@@ -0,0 +1,37 @@
+import pytest
+
+import ledger_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(ledger_cache, "_entries", {})
+    monkeypatch.setattr(ledger_cache, "_log", {})
+
+
+def _row(txn_id):
+    return [txn_id, "2026-10-19 12:00:00", "10", "2026", 5.0, "Taxi", "Otros", "Telegram Bot", "pending_classification"]
+
+
+def test_local_write_does_not_hide_a_write_from_another_process():
+    ledger_cache.load("S", 100, ["txn_1"], [dict(zip(ledger_cache.COLUMNS, _row("txn_1")))])
+    # The dashboard classifies txn_1 (v200), then this process appends txn_2 (v300)
+    ledger_cache.record_append("S", [_row("txn_2")], 300)
+
+    # Sheets is at our version, but that doesn't prove nothing happened in between
+    assert not ledger_cache.renew("S", 300)
+
+    # The reload sees txn_1 classified and replays nothing older than what it read
+    ledger_cache.load("S", 300, ["txn_2"], [dict(zip(ledger_cache.COLUMNS, _row("txn_2")))])
+    assert ledger_cache.pending("S", 10)[0] == ["txn_2"]
+    assert ledger_cache.renew("S", 300)
+
+
+def test_writes_are_served_before_the_reload():
+    ledger_cache.load("S", 100, [], [])
+    ledger_cache.record_append("S", [_row("txn_2")], 300)
+    assert ledger_cache.pending("S", 10)[0] == ["txn_2"]
+
+    # A reload read at an older version replays the write on top
+    ledger_cache.load("S", 200, [], [])
+    assert ledger_cache.pending("S", 10)[0] == ["txn_2"]
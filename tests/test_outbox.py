@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import outbox
+
+
+def _restart(monkeypatch):
+    """Forget the in-memory state, as a new process would."""
+    monkeypatch.setattr(outbox, "_entries", None)
+    monkeypatch.setattr(outbox, "_next_seq", 1)
+    monkeypatch.setattr(outbox, "_lines", 0)
+    monkeypatch.setattr(outbox, "_uncertain", set())
+
+
+@pytest.fixture(autouse=True)
+def journal(tmp_path, monkeypatch):
+    path = tmp_path / "outbox.jsonl"
+    monkeypatch.setattr(outbox, "OUTBOX_FILE", str(path))
+    _restart(monkeypatch)
+    return path
+
+
+def _row(txn_id):
+    return [txn_id, "2026-10-19 12:00:00", "10", "2026", 5.0, "Taxi", "Otros", "Telegram Bot", "pending_classification"]
+
+
+def test_torn_tail_is_cut_before_the_next_append(journal, monkeypatch):
+    outbox.enqueue(_row("txn_1"), chat_id=1)
+    # Crash in the middle of writing the second record
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "seq": 2, "ro')
+
+    _restart(monkeypatch)
+    seq = outbox.enqueue(_row("txn_3"), chat_id=1)
+    assert seq == 2
+
+    _restart(monkeypatch)
+    assert [e["row"][0] for e in outbox.pending()] == ["txn_1", "txn_3"]
+    assert all(json.loads(line) for line in journal.read_text(encoding="utf-8").splitlines())
+
+
+def test_record_glued_to_an_old_fragment_is_recovered(journal, monkeypatch):
+    # Journals written before the cut: the next record landed on the fragment's line
+    record = json.dumps({"op": "add", "seq": 2, "row": _row("txn_3"), "chat_id": 1, "spreadsheet_id": None})
+    journal.write_text('{"op": "add", "seq": 2, "ro' + record + "\n", encoding="utf-8")
+
+    assert [e["row"][0] for e in outbox.pending()] == ["txn_3"]
+    assert outbox.enqueue(_row("txn_4"), chat_id=1) == 3
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+import search
+
+COLUMNS = ["id", "date", "month", "year", "amount", "description", "category", "source", "status"]
+
+
+@pytest.fixture(autouse=True)
+def fresh_indexes(monkeypatch):
+    monkeypatch.setattr(search, "_indexes", {})
+
+
+def _history():
+    return pd.DataFrame([
+        ["txn_1", "2026-09-01 10:00:00", "09", "2026", 39.9, "Netflix", "Ocio", "Yape", "verified"],
+        ["txn_2", "2026-09-03 13:00:00", "09", "2026", 15.0, "Menu almuerzo", "Comida", "Plin", "verified"],
+    ], columns=COLUMNS)
+
+
+def test_local_write_before_first_search_does_not_hide_the_history():
+    # handle_message / the outbox index the new row before anyone searched
+    search.index_row("sheet", ["txn_3", "2026-10-19 09:00:00", "10", "2026", 8.0, "Taxi", "Otros", "Telegram Bot", "pending_classification"])
+    assert not search.is_synced("sheet", 5)
+
+    search.sync("sheet", _history(), data_version=5)
+
+    assert search.is_synced("sheet", 5)
+    assert [r["id"] for r in search.query("sheet", "netf")] == ["txn_1"]
+    assert [r["id"] for r in search.query("sheet", "taxi")] == ["txn_3"]
+
+
+def test_a_new_data_version_needs_a_sync():
+    search.sync("sheet", _history(), data_version=5)
+    assert not search.is_synced("sheet", 6)
+    assert not search.is_synced("sheet", 0)
+
+    # Classified from the dashboard meanwhile
+    changed = _history()
+    changed.loc[1, "category"] = "Ocio"
+    assert search.sync("sheet", changed, data_version=6) == 0
+    assert search.query("sheet", "menu")[0]["category"] == "Ocio"
+
+
+def test_own_write_does_not_need_a_full_sync(monkeypatch):
+    search.sync("sheet", _history(), data_version=5)
+    # This process appended a row: Sheets moved to v6, which we wrote
+    search.index_row("sheet", ["txn_3", "2026-10-19 09:00:00", "10", "2026", 8.0, "Taxi", "Otros", "Telegram Bot", "verified"])
+    assert search.is_synced("sheet", 6, written_version=6)
+    # Someone else wrote after us
+    assert not search.is_synced("sheet", 7, written_version=6)
+
+    # Bounded: after MAX_STALENESS a sync is due even if the last write is ours
+    monkeypatch.setattr(search, "MAX_STALENESS", -1)
+    assert not search.is_synced("sheet", 6, written_version=6)